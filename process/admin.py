@@ -1,6 +1,6 @@
 from .exceptions import ProcessException
 from .forms import JobForm, JobTaskForm, TaskForm
-from .models import Job, JobTask, Process, Task, TaskDependence
+from .models import Job, JobTask, JobTaskUsage, Lease, Process, Task, TaskDependence
 from django.contrib import admin, messages
 from django.utils.translation import ngettext
 from django.utils.translation import gettext_lazy as _
@@ -10,7 +10,7 @@ from django.utils.translation import gettext_lazy as _
 @admin.register(Process)
 class ProcessAdmin(admin.ModelAdmin):
     actions = ['run_on_demand']
-    list_display = ('__str__', 'description', 'is_active', 'recurrence')
+    list_display = ('__str__', 'description', 'is_active', 'recurrence', 'next_run_at')
     list_filter = ('is_active',)
     search_fields = ('name', 'description')
 
@@ -100,16 +100,30 @@ class JobAdmin(admin.ModelAdmin):
     cancel.short_description = _('cancel')
 
 
+class JobTaskUsageInline(admin.StackedInline):
+    model = JobTaskUsage
+    can_delete = False
+    readonly_fields = (
+        'user_time', 'system_time', 'max_rss_bound', 'block_input', 'block_output', 'voluntary_switches',
+        'involuntary_switches'
+    )
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(JobTask)
 class JobTaskAdmin(admin.ModelAdmin):
     form = JobTaskForm
+    inlines = [JobTaskUsageInline]
     list_filter = ('status',)
     list_display = ('__str__', 'dt_start', 'dt_end', 'observations')
 
     # noinspection PyUnusedLocal
     def get_readonly_fields(self, request, obj=None):
         if obj:
-            return self.readonly_fields + ('pid', 'job', 'task', 'dt_start', 'dt_end', 'observations')
+            return self.readonly_fields + ('pid', 'worker', 'job', 'task', 'dt_start', 'dt_end', 'observations')
         return self.readonly_fields
 
     def get_queryset(self, request):
@@ -123,3 +137,13 @@ class JobTaskAdmin(admin.ModelAdmin):
     # noinspection PyMethodMayBeStatic, PyUnusedLocal
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(Lease)
+class LeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'holder', 'dt_heartbeat', 'dt_expire')
+    readonly_fields = ('name', 'holder', 'dt_heartbeat', 'dt_expire')
+
+    # noinspection PyMethodMayBeStatic, PyUnusedLocal
+    def has_add_permission(self, request):
+        return False
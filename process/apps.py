@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ProcessConfig(AppConfig):
     name = 'process'
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from . import signals
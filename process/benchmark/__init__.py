@@ -0,0 +1,3 @@
+"""
+benchmarks of django-process, each suite returns a dictionary which the benchmark command prints as json
+"""
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import signal
+import statistics
+import subprocess
+from django.db.models import Max, Min
+
+from process.dag import get_dag
+from process.models import Job, JobTask
+from .workload import create_workload, delete_workload
+
+"""
+end to end run of the jobs of the synthetic processes by a run_jobs subprocess, run_jobs takes any task awaiting so
+it should be run against a database used only for benchmarking
+"""
+
+
+def start_latencies(jobs):
+    """
+    :return: seconds since each task instance was ready (created or its last parent ended) until it started
+    """
+    rows = JobTask.objects.filter(job__in=jobs).values_list('job_id', 'task_id', 'dt_created', 'dt_start', 'dt_end')
+    ends = {(job_id, task_id): dt_end for job_id, task_id, __, __, dt_end in rows}
+    dags = {job.id: get_dag(job.process) for job in jobs}
+    latencies = []
+    for job_id, task_id, dt_created, dt_start, __ in rows:
+        if not dt_start:
+            continue
+        parents = [ends[(job_id, parent)] for parent in dags[job_id].parents.get(task_id, [])]
+        ready_at = max([dt for dt in parents if dt] + [dt_created])
+        latencies.append(max((dt_start - ready_at).total_seconds(), 0))
+    return latencies
+
+
+def summary(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'p50': statistics.median(values),
+        'p95': values[min(int(len(values) * 0.95), len(values) - 1)],
+        'max': values[-1],
+        'mean': statistics.mean(values),
+    }
+
+
+def read_profile(output):
+    # the profile is the last json object written by run_jobs when it stops
+    start = output.rfind('\n{')
+    try:
+        return json.loads(output[start + 1:] if start >= 0 else output)
+    except ValueError:
+        return None
+
+
+def run(manage, processes=10, width=5, depth=3, timeout=300, keep=False):
+    """
+    :param manage: path of the manage.py of the project which runs run_jobs
+    """
+    workload = create_workload(processes, width, depth)
+    try:
+        jobs = [Job.create(process)[0] for process in workload]
+        total = JobTask.objects.filter(job__in=jobs).count()
+
+        start = time.perf_counter()
+        runner = subprocess.Popen(
+            [sys.executable, manage, 'run_jobs', '--profile', str(timeout * 2)],
+            stdout=subprocess.PIPE, text=True
+        )
+        done = 0
+        while time.perf_counter() - start < timeout:
+            done = JobTask.objects.filter(job__in=jobs, status__in=JobTask.ok_status + [JobTask.error]).count()
+            if done == total:
+                break
+            time.sleep(0.1)
+        makespan = time.perf_counter() - start
+
+        runner.send_signal(signal.SIGINT)
+        output = runner.stdout.read()
+        __, status, usage = os.wait4(runner.pid, 0)
+        runner.returncode = os.waitstatus_to_exitcode(status)
+
+        profile = read_profile(output)
+        ticks = profile and profile['ticks']
+        queries = profile and sum(phase['queries']['total'] for phase in profile['phases'].values())
+        dates = JobTask.objects.filter(job__in=jobs).aggregate(first=Min('dt_start'), last=Max('dt_end'))
+        # linux reports the max rss in kilobytes, macOS in bytes
+        max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        return {
+            'jobs': len(jobs),
+            'tasks': total,
+            'tasks_done': done,
+            'tasks_error': JobTask.objects.filter(job__in=jobs, status=JobTask.error).count(),
+            'completed': done == total,
+            'makespan_seconds': makespan,
+            'tasks_span_seconds': (dates['last'] - dates['first']).total_seconds() if dates['last'] else None,
+            'tasks_per_second': done / makespan if makespan else None,
+            'dispatch_latency_seconds': summary(start_latencies(jobs)),
+            'ticks': ticks,
+            'queries_per_tick': queries / ticks if ticks else None,
+            'run_jobs_max_rss_kb': max_rss_kb,
+            'profile': profile,
+        }
+    finally:
+        if not keep:
+            delete_workload(workload)
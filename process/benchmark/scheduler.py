@@ -0,0 +1,38 @@
+import time
+from django.db import connection
+from django.utils import timezone
+
+from process.management.commands._actions import run_jobs
+from process.management.commands._profile import QueryCounter
+from process.models import Process, Job
+from .workload import create_workload, delete_workload
+
+"""
+jobs created by the scheduler, all the processes are due at the same time as after a busy minute
+"""
+
+
+def run(processes=100, width=5, depth=3, keep=False):
+    workload = create_workload(processes, width, depth, active=True)
+    try:
+        now = timezone.now()
+        Process.objects.filter(pk__in=[p.pk for p in workload]).update(next_run_at=now)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            run_jobs(now)
+        elapsed = time.perf_counter() - start
+
+        jobs = Job.objects.filter(process__in=workload).count()
+        return {
+            'jobs': jobs,
+            'tasks_per_job': width * depth,
+            'seconds': elapsed,
+            'jobs_per_minute': jobs / elapsed * 60 if elapsed else None,
+            'queries': counter.queries,
+            'db_seconds': counter.time,
+        }
+    finally:
+        if not keep:
+            delete_workload(workload)
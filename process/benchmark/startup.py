@@ -0,0 +1,80 @@
+import os
+import sys
+import statistics
+import subprocess
+from django.conf import settings
+
+from process.bootstrap import PROJECT_PATH, SETTINGS_MODULE, APPS
+
+"""
+import cost of process.env in a fresh interpreter as a task script pays it, importing process.env always sets
+django up so the variants differ in how the project is located and in the apps loaded
+"""
+
+SCRIPT = '''
+import time
+start = time.perf_counter()
+import process.env
+print(time.perf_counter() - start)
+'''
+
+# process.env as it was before process.bootstrap, it always reads env_conf.json and loads all the apps
+ENV_FILE_SCRIPT = '''
+import time
+start = time.perf_counter()
+import os
+import sys
+import json
+import django
+
+file = os.path.join(os.path.dirname(os.path.abspath(__import__('process').__file__)), 'env_conf.json')
+if not os.path.isfile(file):
+    file = os.path.join(os.getcwd(), 'env_conf.json')
+with open(file, 'r') as f:
+    environment = json.load(f)
+if environment['project_path'] not in sys.path:
+    sys.path.insert(0, environment['project_path'])
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', environment['project_settings'])
+if os.environ.get('DJANGO_SETTINGS_MODULE'):
+    django.setup()
+print(time.perf_counter() - start)
+'''
+
+
+def measure(script, env, runs):
+    """
+    :return: seconds spent by script bootstrapping django on each run
+    """
+    times = []
+    for __ in range(runs):
+        out = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def summary(times):
+    return {
+        'runs': len(times),
+        'min': min(times),
+        'median': statistics.median(times),
+        'max': max(times),
+    }
+
+
+def run(runs=10, apps=None):
+    """
+    compares the bootstrap before process.bootstrap existed (env_conf.json), from the environment and in lite mode
+    with apps
+    """
+    base = {k: v for k, v in os.environ.items() if k not in (PROJECT_PATH, SETTINGS_MODULE, APPS)}
+    # the interpreter must find django-process itself the same way run_jobs does
+    base['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    environment = {**base, PROJECT_PATH: str(settings.BASE_DIR), SETTINGS_MODULE: os.environ[SETTINGS_MODULE]}
+    variants = {
+        'env_file': (ENV_FILE_SCRIPT, base),
+        'environment': (SCRIPT, environment),
+    }
+    if apps:
+        variants['lite'] = (SCRIPT, {**environment, APPS: ','.join(apps)})
+
+    return {name: summary(measure(script, env, runs)) for name, (script, env) in variants.items()}
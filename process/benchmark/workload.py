@@ -0,0 +1,55 @@
+import uuid
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from process.dag import bump_dag_version
+from process.models import Process, Task, TaskDependence
+
+"""
+synthetic processes for the benchmarks, each one is a graph of depth levels with width no-op tasks each, every
+task depends on all the tasks of the previous level
+"""
+
+NOOP_CODE = 'dj_process_tasks/benchmark_noop.sh'
+
+
+def noop_code():
+    if not default_storage.exists(NOOP_CODE):
+        default_storage.save(NOOP_CODE, ContentFile(b'exit 0\n'))
+    return NOOP_CODE
+
+
+def create_workload(processes, width, depth, active=False):
+    """
+    :return: the processes created, inactive ones are ignored by the scheduler so only their jobs run
+    """
+    # process names are 20 characters at most
+    prefix = f'bm-{uuid.uuid4().hex[:8]}'
+    code = noop_code()
+    created = []
+    for i in range(processes):
+        process = Process.objects.create(
+            name=f'{prefix}-{i}', description=f'{prefix}-{i}', is_active=active,
+            minute='*', hour='*', day_of_month='*', month='*', day_of_week='*'
+        )
+        tasks = Task.objects.bulk_create([
+            Task(
+                process=process, name=f'{process.name}-{level}-{n}', description=f'{process.name}-{level}-{n}',
+                level=level, interpreter='sh', code=code
+            )
+            for level in range(depth) for n in range(width)
+        ])
+        # bulk_create sets the primary keys back on postgres and sqlite only
+        tasks = list(Task.objects.filter(process=process).order_by('level', 'id'))
+        levels = [tasks[level * width:(level + 1) * width] for level in range(depth)]
+        TaskDependence.objects.bulk_create([
+            TaskDependence(parent=parent, task=task)
+            for parents, childs in zip(levels, levels[1:]) for task in childs for parent in parents
+        ])
+        bump_dag_version(process.id)
+        created.append(process)
+    return created
+
+
+def delete_workload(processes):
+    Process.objects.filter(pk__in=[process.pk for process in processes]).delete()
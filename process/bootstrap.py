@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import logging
+
+logger = logging.getLogger('django-process')
+
+"""
+bootstrap of django for the task scripts, run_jobs passes the project path and the settings module to the tasks as
+environment variables so env_conf.json is only read when the script was started by other means
+"""
+
+PROJECT_PATH = 'DJANGO_PROCESS_PROJECT_PATH'
+SETTINGS_MODULE = 'DJANGO_SETTINGS_MODULE'
+# comma separated apps loaded in lite mode
+APPS = 'DJANGO_PROCESS_APPS'
+
+ENV_FILE = 'env_conf.json'
+
+
+def read_env_file():
+    file = os.path.join(os.path.dirname(os.path.abspath(__file__)), ENV_FILE)
+    if not os.path.isfile(file):
+        logger.debug('env file not found in default location lets try in current working dir')
+        file = os.path.join(os.getcwd(), ENV_FILE)
+        if not os.path.isfile(file):
+            raise FileNotFoundError('env file could not be located')
+
+    with open(file, 'r') as f:
+        return json.load(f)
+
+
+def configure():
+    """
+    puts the project in sys.path and sets the settings module
+    """
+    project_path = os.environ.get(PROJECT_PATH)
+    if not project_path or not os.environ.get(SETTINGS_MODULE):
+        environment = read_env_file()
+        project_path = project_path or environment['project_path']
+        os.environ.setdefault(SETTINGS_MODULE, environment['project_settings'] or '')
+
+    if project_path not in sys.path:
+        sys.path.insert(0, project_path)
+
+
+def lite_apps(installed, apps):
+    """
+    :return: the installed apps which match any of apps by its module e.g. 'myapp' matches 'myapp.apps.MyConfig'
+    """
+    return [
+        installed_app for installed_app in installed
+        if any(installed_app == app or installed_app.startswith(f'{app}.') for app in apps)
+    ]
+
+
+def setup(apps=None):
+    """
+    configures and setups django, if apps are given only those apps are loaded (lite mode) which is enough for
+    tasks which use the orm for a few models, they must include the apps their models depend on
+    e.g. setup(apps=['django.contrib.contenttypes', 'myapp'])
+    """
+    configure()
+    if not os.environ.get(SETTINGS_MODULE):
+        return
+
+    import django
+    from django.apps import apps as registry
+    if registry.ready:
+        return
+
+    if apps is None and os.environ.get(APPS):
+        apps = os.environ[APPS].split(',')
+    if apps:
+        from django.conf import settings
+        settings.INSTALLED_APPS = lite_apps(settings.INSTALLED_APPS, [app.strip() for app in apps])
+
+    django.setup()
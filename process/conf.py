@@ -1,4 +1,6 @@
+import os
 import logging
+import tempfile
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
@@ -45,7 +47,60 @@ def dummy_task_error_handler(task_id, exception): pass
 # noinspection SpellCheckingInspection
 default_settings = {
     'task': {
-        'error_handler': dummy_task_error_handler
+        'error_handler': dummy_task_error_handler,
+        # max task instances running at once in each run_jobs worker (0 unlimited)
+        'max_workers': 0,
+        # execution engine: 'thread' one thread per task or 'asyncio' one event loop for all the tasks
+        'engine': 'thread',
+        # seconds between SIGTERM and SIGKILL when a task reaches its timeout
+        'kill_grace': 10,
+        # task instances left initialized by a worker which is gone are set to 'error' or 'awaiting' to run them
+        # again, they are looked for when run_jobs starts and each interval seconds
+        'orphans': {
+            'policy': 'error',
+            'interval': 60,
+        },
+        # python tasks with the default interpreter are forked from a process which has django loaded already
+        'forkserver': {
+            'enabled': False,
+            # modules imported by the fork server besides process.env e.g. the project models
+            'preload': [],
+        },
+        # local copies of the code files in storages without local path (e.g. S3) by content hash
+        'code_cache': {
+            'dir': os.path.join(tempfile.gettempdir(), 'dj_process_tasks'),
+            'max_bytes': 256 * 1024 * 1024,
+        },
+        # seconds the historical mean duration of the tasks is cached for the critical path priority
+        'duration_cache': 300,
+        'log': {
+            # directory of the task instances output, None means BASE_DIR/dj_process_logs
+            'dir': None,
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 3,
+            # last bytes of the output kept in the task instance observations
+            'tail_bytes': 4000,
+        },
+    },
+    'dispatcher': {
+        # seconds between dispatches, it starts at min_interval after any activity and doubles up to heartbeat
+        'min_interval': 0.1,
+        'heartbeat': 5,
+        # dotted path to a process.notifications backend so other processes can wake the dispatcher up
+        'notification_backend': None,
+        'notification_channel': 'django_process',
+    },
+    'scheduler': {
+        # seconds the worker creating the jobs keeps the leadership without renewing it, it renews each third
+        'lease_ttl': 30,
+    },
+    'metrics': {
+        # directory of the workers snapshots, None means BASE_DIR/dj_process_metrics
+        'dir': None,
+        # seconds between snapshots and age after which the snapshot of a worker is considered gone
+        'interval': 15,
+        'stale': 120,
+        'buckets': [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600],
     },
     'views': {
         'paginate': 20,
@@ -141,7 +196,15 @@ default_settings = {
             'management': {
                 'success_message': _('task successfully {action}'),
                 'permissions': ['process.view_job_tasks', 'process.manage_job_tasks'],
-            }
+            },
+            'log': {
+                'permissions': ['process.view_job_tasks'],
+            },
+        },
+        'metrics': {
+            # scrapers usually can not log in, public skips the login and the permissions
+            'public': False,
+            'permissions': ['process.view_jobs'],
         },
     },
     'diagram': {
@@ -0,0 +1,97 @@
+import logging
+from django.db.models import F
+
+from process.models import Process, Task
+
+logger = logging.getLogger('django-process')
+
+# graphs by process id {process_id: (dag_version, ProcessDAG)}
+_dags = {}
+
+
+class ProcessDAG:
+    """
+    In-memory graph of the tasks of a process loaded with a single query, it holds the adjacency lists, a topological
+    order, the depth of each task (longest distance from a task without parents) and the width (max tasks at the same
+    depth)
+    """
+    def __init__(self, process_id, rows):
+        """
+        :param rows: (task_id, task_name, parent_id) one per dependency, parent_id is None for tasks without parents
+        """
+        self.process_id = process_id
+        self.names = {}
+        self.parents = {}
+        self.childs = {}
+        for task_id, name, parent_id in rows:
+            self.names[task_id] = name
+            self.parents.setdefault(task_id, [])
+            self.childs.setdefault(task_id, [])
+            if parent_id is not None:
+                self.parents[task_id].append(parent_id)
+                self.childs.setdefault(parent_id, []).append(task_id)
+
+        # kahn's algorithm, tasks left out of the order are part of a cycle
+        self.order = []
+        self.depth = {}
+        pending = {task_id: len(parents) for task_id, parents in self.parents.items()}
+        roots = [task_id for task_id, count in pending.items() if not count]
+        for task_id in roots:
+            self.depth[task_id] = 0
+        while roots:
+            task_id = roots.pop()
+            self.order.append(task_id)
+            for child in self.childs.get(task_id, []):
+                self.depth[child] = max(self.depth.get(child, 0), self.depth[task_id] + 1)
+                pending[child] -= 1
+                if not pending[child]:
+                    roots.append(child)
+
+        levels = {}
+        for depth in self.depth.values():
+            levels[depth] = levels.get(depth, 0) + 1
+        self.width = max(levels.values(), default=0)
+
+    @classmethod
+    def load(cls, process_id):
+        rows = Task.objects.filter(process_id=process_id).order_by().values_list('id', 'name', 'parents__parent_id')
+        return cls(process_id, rows)
+
+    @property
+    def is_acyclic(self):
+        return len(self.order) == len(self.parents)
+
+    def descendants(self, task_id):
+        """
+        :return: set of tasks reachable from task_id, each shared descendant is visited once
+        """
+        found = set()
+        pending = list(self.childs.get(task_id, []))
+        while pending:
+            current = pending.pop()
+            if current not in found:
+                found.add(current)
+                pending.extend(self.childs.get(current, []))
+        return found
+
+
+def get_dag(process):
+    """
+    returns the graph of the process from the memory cache, it is loaded again when the dag_version of the process
+    has changed
+    """
+    cached = _dags.get(process.pk)
+    if cached and cached[0] == process.dag_version:
+        return cached[1]
+
+    dag = ProcessDAG.load(process.pk)
+    _dags[process.pk] = (process.dag_version, dag)
+    return dag
+
+
+def bump_dag_version(process_id):
+    """
+    invalidates the graph of the process in every worker, called when its tasks or dependencies change
+    """
+    _dags.pop(process_id, None)
+    Process.objects.filter(pk=process_id).update(dag_version=F('dag_version') + 1)
@@ -1,27 +1,8 @@
-import os
-import sys
-import json
-import django
-import logging
+from process.bootstrap import setup
 
-logger = logging.getLogger('django-process')
+"""
+importing this module setups django for the task scripts right away, set DJANGO_PROCESS_APPS to load only some
+apps or call process.bootstrap.setup() when the orm is first needed to defer the cost
+"""
 
-location = os.path.dirname(os.path.abspath(__file__))
-file = os.path.join(location, 'env_conf.json')
-
-if not os.path.isfile(file):
-    logger.debug('env file not found in default location lets try in current working dir')
-    file = os.path.join(os.getcwd(), 'env_conf.json')
-    if not os.path.isfile(file):
-        raise FileNotFoundError('env file could not be located')
-
-with open(file, 'r') as f:
-    environment = json.load(f)
-
-if environment['project_path'] not in sys.path:
-    sys.path.insert(0, environment['project_path'])
-
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", environment['project_settings'])
-
-if os.environ.get('DJANGO_SETTINGS_MODULE'):
-    django.setup()
+setup()
@@ -2,40 +2,92 @@ import os
 import json
 import logging
 import importlib
+from collections import Counter
 from django.conf import settings
-from django.db.models import ObjectDoesNotExist
+from django.db.models import ObjectDoesNotExist, Count, F, Min, Q, Value
+from django.db.models.functions import Coalesce, Concat
 from django.utils import timezone
+from datetime import timedelta
 
-from process.models import Process, Job, JobTask
+from process.bootstrap import PROJECT_PATH, SETTINGS_MODULE, ENV_FILE
+from process import metrics
+from process.conf import get_conf
+from process.dag import get_dag
+from process.models import Process, Job, JobTask, Lease
+from ._async import TaskAsync
+from ._pool import pool
+from ._priority import prioritize
 from ._task import TaskThreaded
 
 logger = logging.getLogger('django-process')
 
+engines = {
+    'thread': TaskThreaded,
+    'asyncio': TaskAsync,
+}
+
 
 def configure_env():
-    # noinspection PyUnresolvedReferences
-    module = importlib.util.find_spec('process')
-    mod_location = os.path.dirname(module.origin)
-    env_file = os.path.join(mod_location, 'env_conf.json')
+    """
+    the tasks inherit the project location from the environment, env_conf.json is kept for the scripts started
+    by other means and it is only written when it changes
+    """
     environment = {
         'project_path': str(settings.BASE_DIR),
-        'project_settings': os.environ.get('DJANGO_SETTINGS_MODULE')
+        'project_settings': os.environ.get(SETTINGS_MODULE)
     }
+    os.environ[PROJECT_PATH] = environment['project_path']
+
+    # noinspection PyUnresolvedReferences
+    module = importlib.util.find_spec('process')
+    mod_location = os.path.dirname(module.origin)
+    env_file = os.path.join(mod_location, ENV_FILE)
+    try:
+        with open(env_file, 'r') as f:
+            if json.load(f) == environment:
+                return
+    except (OSError, ValueError):
+        pass
+
     try:
         with open(env_file, 'w') as f:
             json.dump(environment, f)
     except Exception as e:
         logger.exception(f'django-process environment could not be configured due to =>\n{e}')
         logger.debug('configuring to current working directory instead')
-        with open(os.path.join(os.getcwd(), 'env_conf.json'), 'w') as f:
+        with open(os.path.join(os.getcwd(), ENV_FILE), 'w') as f:
             json.dump(environment, f)
 
 
+def schedule_processes(date):
+    """
+    Set the next run date of the active processes which have not been scheduled yet e.g. right after migrating or
+    when they were stored without save(), it is a single indexed query when there are none besides the processes
+    whose crontab never matches, they are left unscheduled
+    :return: number of processes scheduled
+    """
+    scheduled = 0
+    for pr in Process.objects.filter(is_active=True, next_run_at__isnull=True):
+        next_run_at = pr.next_run(date)
+        if next_run_at is None:
+            continue
+        scheduled += Process.objects.filter(pk=pr.pk, next_run_at__isnull=True).update(next_run_at=next_run_at)
+    return scheduled
+
+
 def run_jobs(date):
     """
-    Start Job and it's tasks
+    Start Job and it's tasks of the processes due, returns the date when it must be called again which is at most
+    the next minute so the processes updated meanwhile are not missed
     """
-    for pr in Process.objects.filter(is_active=True):
+    for pr in Process.objects.filter(is_active=True, next_run_at__lte=date):
+        # reschedule before anything else so the process does not fire twice in the same minute, if it was
+        # rescheduled meanwhile another worker has taken care of it
+        rescheduled = Process.objects.filter(pk=pr.pk, next_run_at=pr.next_run_at).update(
+            next_run_at=pr.next_run(date)
+        )
+        if not rescheduled:
+            continue
         must_run = pr.must_run(date)
         logger.debug(f'process {pr} must run {must_run}')
         if must_run:
@@ -59,40 +111,170 @@ def run_jobs(date):
 
             __, __ = Job.create(pr)
 
+    next_minute = date.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    next_run = Process.objects.filter(is_active=True).aggregate(next_run=Min('next_run_at'))['next_run']
+    return min(next_run, next_minute) if next_run else next_minute
+
 
 def run_awaiting_tasks():
     """
-    Run all pending tasks if their status is pending and their parent tasks are finished
+    Run all pending tasks if their status is pending and their parent tasks are finished, while there are free
+    slots in the pool and the process or task max_parallel limits are not reached, the rest keep awaiting. If there
+    are more tasks ready than free slots they are started by priority
+    :return: number of tasks started
     """
-    jobs = Job.objects.filter(status__in=Job.unfinished).exclude(
-        id__in=JobTask.objects.filter(status=JobTask.initialized).values_list('job_id')
-    )
-    for job in jobs:
-        for task in JobTask.objects.filter(status__in=JobTask.run_status, job=job):
-            if task.ready_to_run:
-                # mark task instance as initialized
-                TaskThreaded(task).start()
+    started = 0
+    # awaiting tasks started, their start latency is observed
+    awaited = []
+    ready = JobTask.ready()
+    metrics.ready_tasks.set(len(ready))
+    free_slots = pool.free_slots
+    if not ready or free_slots == 0:
+        return 0
+
+    # when there are not slots enough for all of them start first the ones on the critical path
+    if free_slots is not None and len(ready) > free_slots:
+        ready = prioritize(ready)
+
+    engine = engines[get_conf('task__engine')]
+    running = JobTask.objects.filter(status=JobTask.initialized).values_list('job__process_id', 'task_id')
+    running_by_process = Counter(process_id for process_id, __ in running)
+    running_by_task = Counter(task_id for __, task_id in running)
+    for task in ready:
+        if pool.free_slots == 0:
+            break
+
+        process = task.job.process
+        if process.max_parallel and running_by_process[process.id] >= process.max_parallel:
+            continue
+        if task.task.max_parallel and running_by_task[task.task_id] >= task.task.max_parallel:
+            continue
+
+        # mark task instance as initialized unless another worker was faster
+        status = task.status
+        if not task.claim(pool.worker):
+            continue
+        engine(task).start()
+        running_by_process[process.id] += 1
+        running_by_task[task.task_id] += 1
+        started += 1
+        if status == JobTask.awaiting:
+            awaited.append(task)
+        else:
+            metrics.task_transitions.inc(status=JobTask.initialized)
+
+    metrics.running_tasks.set(len(pool.running))
+    observe_start_latency(awaited)
+    return started
+
+
+def observe_start_latency(tasks):
+    """
+    a task instance is ready when it was created or when the last of its parents ended, the end of the parents of
+    all the tasks started is read in one query, only the awaiting ones are observed since a retry has no ready date
+    """
+    if not tasks:
+        return
+
+    parents = {task.pk: get_dag(task.job.process).parents.get(task.task_id, []) for task in tasks}
+    ends = JobTask.objects.filter(
+        job_id__in={task.job_id for task in tasks},
+        task_id__in={parent for task_parents in parents.values() for parent in task_parents},
+        dt_end__isnull=False
+    ).values_list('job_id', 'task_id', 'dt_end')
+    ends = {(job_id, task_id): dt_end for job_id, task_id, dt_end in ends}
+
+    for task in tasks:
+        metrics.task_transitions.inc(status=JobTask.initialized)
+        dates = [ends[(task.job_id, p)] for p in parents[task.pk] if (task.job_id, p) in ends]
+        ready_at = max(dates + [task.dt_created] if task.dt_created else dates, default=None)
+        if ready_at:
+            latency = (task.dt_start - ready_at).total_seconds()
+            metrics.task_start_latency.observe(max(latency, 0), process=task.job.process.name)
 
 
 def finish_jobs():
     """
-    select all initialized(unfinished) jobs if all it's tasks are finished then finish it self
+    select all initialized(unfinished) jobs if all it's tasks are finished then finish it self, jobs without tasks
+    are not finished, it takes one aggregate query plus one update whatever the number of jobs
+    :return: number of jobs finished
+    """
+    jobs = Job.objects.filter(status__in=Job.unfinished).annotate(
+        total=Count('tasks'),
+        ok=Count('tasks', filter=Q(tasks__status__in=JobTask.ok_status))
+    ).filter(total__gt=0, ok=F('total')).values_list('id', flat=True)
+    ids = list(jobs)
+    if not ids:
+        return 0
+
+    return Job.objects.filter(id__in=ids, status__in=Job.unfinished).update(
+        status=Job.finished, dt_end=timezone.now()
+    )
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_orphan(worker, pid, alive):
+    """
+    a task instance is orphan if its worker is not running anymore, workers of other hosts are alive while they
+    renew their lease, in this host the worker and the task processes are checked so a task which is still running
+    is left alone until it finishes
     """
-    def custom_all(plist):
-        """
-        all() builtin function will return True if an empty list is passed
-        :param plist:
-        """
-        if not plist:
+    if worker in alive:
+        return False
+
+    host = pool.worker.rsplit(':', 1)[0]
+    if not worker or worker.rsplit(':', 1)[0] == host:
+        worker_pid = int(worker.rsplit(':', 1)[1]) if worker else 0
+        if worker_pid and worker_pid != os.getpid() and pid_alive(worker_pid):
             return False
-        return all(plist)
+        return not pid or not pid_alive(pid)
+
+    return True
+
+
+def recover_orphans():
+    """
+    applies the orphans policy to the initialized task instances nobody is supervising anymore e.g. after run_jobs
+    or the host was restarted, it takes three queries (one purges the leases of the stopped workers) plus the updates
+    of the orphans if any
+    :return: number of task instances recovered
+    """
+    Lease.purge_workers()
+    tasks = JobTask.objects.filter(status=JobTask.initialized).values_list('id', 'job_id', 'pid', 'worker')
+    tasks = [t for t in tasks if t[0] not in pool.running]
+    if not tasks:
+        return 0
+
+    workers = {worker for __, __, __, worker in tasks if worker and worker != pool.worker}
+    alive = set(Lease.objects.filter(
+        name__in=[Lease.worker(worker) for worker in workers], dt_expire__gte=timezone.now()
+    ).values_list('holder', flat=True))
+    orphans = [(pk, job_id) for pk, job_id, pid, worker in tasks if is_orphan(worker, pid, alive)]
+    if not orphans:
+        return 0
 
+    ids = [pk for pk, __ in orphans]
+    logger.error(f'task instances {ids} were left initialized by a worker which is gone')
+    queryset = JobTask.objects.filter(pk__in=ids, status=JobTask.initialized)
+    if get_conf('task__orphans__policy') == JobTask.awaiting:
+        recovered = queryset.update(status=JobTask.awaiting, pid=0, worker=None, dt_start=None, dt_end=None)
+        metrics.task_transitions.inc(recovered, status=JobTask.awaiting)
+        return recovered
 
-    jobs = Job.objects.filter(status__in=Job.unfinished).exclude(
-        id__in=JobTask.objects.filter(status=JobTask.initialized).values_list('job_id')
+    recovered = queryset.update(
+        status=JobTask.error,
+        dt_end=timezone.now(),
+        observations=Concat(Coalesce('observations', Value('')), Value('\nits worker stopped while it was running'))
     )
-    for job in jobs:
-        if custom_all([i['status'] in JobTask.ok_status for i in job.tasks.all().values('status')]):
-            job.status = Job.finished
-            job.dt_end = timezone.now()
-            job.save()
+    Job.objects.filter(pk__in={job_id for __, job_id in orphans}, status=Job.initialized).update(status=Job.error)
+    metrics.task_transitions.inc(recovered, status=JobTask.error)
+    return recovered
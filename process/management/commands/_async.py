@@ -0,0 +1,146 @@
+import os
+import asyncio
+import logging
+from threading import Thread, Lock
+
+from ._forkserver import forkserver, ForkedProcess
+from ._task import TaskRunner
+
+logger = logging.getLogger('django-process')
+
+
+class AsyncEngine:
+    """
+    a single event loop thread supervising all the child processes, it is started with the first task
+    """
+    def __init__(self):
+        self.loop = None
+        self.lock = Lock()
+        # the loop only keeps weak references to its tasks, the futures keep them alive until they are done
+        self.futures = set()
+
+    def submit(self, coroutine):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                Thread(target=self.loop.run_forever, name='django-process-asyncio', daemon=True).start()
+            future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+            self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+
+engine = AsyncEngine()
+
+
+def wait_in_thread(loop, pid):
+    """
+    :return: future of os.wait4(pid) done by a dedicated daemon thread
+    """
+    future = loop.create_future()
+
+    def wait():
+        try:
+            result = os.wait4(pid, 0)
+        except Exception as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, result)
+
+    Thread(target=wait, name=f'django-process-wait-{pid}', daemon=True).start()
+    return future
+
+
+class TaskAsync(TaskRunner):
+    """
+    asyncio engine, the task instance is supervised by a coroutine instead of a thread, the database is accessed
+    from the loop executor because the ORM can not be used inside the event loop
+    """
+    def __init__(self, obj):
+        super().__init__(obj)
+        self.transports = []
+
+    def start(self):
+        engine.submit(self.run())
+
+    async def connect(self, pipe):
+        """
+        wraps a pipe of the child in a stream reader of the loop, the transport is kept until the task is closed
+        since the protocol only holds a weak reference to the reader
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        transport, __ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        self.transports.append(transport)
+        return reader
+
+    @staticmethod
+    async def wait(p):
+        """
+        waits the child with os.wait4 to get its resource usage, asyncio does not give it, the loop is woken up by a
+        pidfd where the platform supports it otherwise by a thread of its own as asyncio ThreadedChildWatcher does,
+        the executor is left for the ORM calls since a wait lasts as long as the task
+        """
+        loop = asyncio.get_running_loop()
+        if isinstance(p, ForkedProcess):
+            exited = loop.create_future()
+            p.add_exit_callback(lambda code: loop.call_soon_threadsafe(exited.set_result, code))
+            return await exited, p.usage
+
+        try:
+            fd = os.pidfd_open(p.pid)
+        except (AttributeError, OSError):
+            __, status, usage = await wait_in_thread(loop, p.pid)
+        else:
+            exited = loop.create_future()
+            loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(fd)
+                os.close(fd)
+            __, status, usage = os.wait4(p.pid, 0)
+
+        p.returncode = os.waitstatus_to_exitcode(status)
+        return p.returncode, usage
+
+    async def pump(self, stream, name):
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            self.output.write(chunk, name)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                cmd = await loop.run_in_executor(None, self.get_command)
+
+                # executing the task and save the PID
+                if self.forked:
+                    p = await loop.run_in_executor(
+                        None, forkserver.spawn, cmd[1], cmd[2:], self.limits, self.session
+                    )
+                else:
+                    p = await loop.run_in_executor(None, self.popen, cmd)
+                stdout, stderr = await self.connect(p.stdout), await self.connect(p.stderr)
+                self.watch(p.pid, loop.call_later)
+                await loop.run_in_executor(None, self.started, p.pid)
+
+                # output of all the tasks is read concurrently by the loop
+                await asyncio.gather(self.pump(stdout, 'stdout'), self.pump(stderr, 'stderr'))
+                returncode, usage = await self.wait(p)
+                self.unwatch()
+                await loop.run_in_executor(None, self.finished, returncode, usage)
+
+            except Exception as e:
+                await loop.run_in_executor(None, self.failed, e)
+
+            await loop.run_in_executor(None, self.close)
+        except Exception as e:
+            logger.exception(f'error {e} when processing task {self.obj}')
+        finally:
+            for transport in self.transports:
+                transport.close()
+            self.release()
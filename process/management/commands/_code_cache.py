@@ -0,0 +1,123 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from threading import Lock
+
+from process.conf import get_conf
+
+logger = logging.getLogger('django-process')
+
+
+class CodeCache:
+    """
+    local copies of the task code files kept in storages without local path (e.g. S3), each file is named after the
+    hash of its content so an updated script never runs the stale copy, the least recently used files are evicted
+    when the directory exceeds max_bytes, files used by running tasks or resolved in the last grace seconds are never
+    evicted
+    """
+    grace = 60
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # local copy of each version of the files {(name, modified time, size): path}
+        self.index = {}
+        # tasks using each file {path: count}
+        self.in_use = {}
+        self.lock = Lock()
+
+    def acquire(self, path):
+        with self.lock:
+            self.in_use[path] = self.in_use.get(path, 0) + 1
+            # the modified time tells the eviction when it was used last
+            os.utime(path)
+
+    def release(self, path):
+        """
+        must be called once the task using path has finished
+        """
+        with self.lock:
+            count = self.in_use.pop(path, 0) - 1
+            if count > 0:
+                self.in_use[path] = count
+
+    def get_path(self, field_file):
+        """
+        :return: local path of the code file, it is downloaded only if this version is not in the cache, the copies
+        in the cache are kept until release(path) is called
+        """
+        storage = field_file.storage
+        try:
+            return storage.path(field_file.name)
+        except NotImplementedError:
+            pass
+
+        try:
+            key = (field_file.name, storage.get_modified_time(field_file.name), storage.size(field_file.name))
+        except NotImplementedError:
+            # without metadata the version can't be known so it is always downloaded
+            key = None
+
+        with self.lock:
+            path = self.index.get(key)
+        if key and path:
+            try:
+                self.acquire(path)
+                return path
+            except FileNotFoundError:
+                pass
+
+        path = self.download(field_file)
+        self.acquire(path)
+        with self.lock:
+            if key:
+                self.index[key] = path
+        self.evict()
+        return path
+
+    def download(self, field_file):
+        """
+        streams the file to a temporary file hashing it on the fly then renames it atomically to its hash
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        extension = os.path.splitext(field_file.name)[1]
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as tmp, field_file.storage.open(field_file.name, 'rb') as remote:
+                for chunk in remote.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            path = os.path.join(self.directory, f'{digest.hexdigest()}{extension}')
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        logger.debug(f'code file {field_file.name} cached as {path}')
+        return path
+
+    def evict(self):
+        with self.lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for __, size, __ in files)
+            recent = time.time() - self.grace
+            for modified, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path in self.in_use or modified >= recent:
+                    continue
+                os.remove(path)
+                total -= size
+                self.index = {key: value for key, value in self.index.items() if value != path}
+                logger.debug(f'code file {path} evicted from cache')
+
+
+code_cache = CodeCache(get_conf('task__code_cache__dir'), get_conf('task__code_cache__max_bytes'))
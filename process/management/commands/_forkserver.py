@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import runpy
+import random
+import signal
+import socket
+import logging
+import importlib
+import itertools
+import traceback
+from types import SimpleNamespace
+from threading import Thread, Lock, Event
+from django.db import connections
+
+from process.conf import get_conf
+from process.exceptions import ProcessException
+from ._limits import set_limits
+
+logger = logging.getLogger('django-process')
+
+# resource usage of the children sent back to run_jobs
+RUSAGE_FIELDS = ('ru_utime', 'ru_stime', 'ru_maxrss', 'ru_inblock', 'ru_oublock', 'ru_nvcsw', 'ru_nivcsw')
+
+
+def send(sock, lock, message, fds=()):
+    with lock:
+        socket.send_fds(sock, [json.dumps(message).encode('utf-8')], list(fds))
+
+
+def run_child(request, fds):
+    """
+    runs the task script in the forked child as if it was executed by the interpreter and never returns
+    """
+    code = 1
+    try:
+        # the handlers run_jobs installed before forking the server are reset as exec would do
+        for signum in signal.valid_signals():
+            if callable(signal.getsignal(signum)):
+                signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        # a preloaded module may have opened a connection, it must not be shared by all the children
+        for conn in connections.all():
+            conn.connection = None
+        if request['session']:
+            os.setsid()
+        set_limits(request['limits'])
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        random.seed()
+
+        sys.argv = [request['path']] + request['args']
+        sys.path.insert(0, os.path.dirname(request['path']))
+        try:
+            runpy.run_path(request['path'], run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                code = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+        except BaseException:
+            traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(sock):
+    """
+    main loop of the fork server, for each request it forks a child which runs the task, the pid is sent back right
+    away and the exit code when the child has finished
+    """
+    lock = Lock()
+    children = {}
+    forked = Event()
+
+    def reap():
+        while True:
+            try:
+                pid, status, usage = os.wait4(-1, 0)
+            except ChildProcessError:
+                forked.wait()
+                forked.clear()
+                continue
+            with lock:
+                request_id = children.pop(pid, None)
+            send(sock, send_lock, {
+                'id': request_id,
+                'pid': pid,
+                'returncode': os.waitstatus_to_exitcode(status),
+                'usage': {field: getattr(usage, field) for field in RUSAGE_FIELDS},
+            })
+
+    send_lock = Lock()
+    Thread(target=reap, daemon=True).start()
+    while True:
+        data, fds, __, __ = socket.recv_fds(sock, 65536, 2)
+        if not data:
+            # run_jobs has finished
+            os._exit(0)
+
+        request = json.loads(data)
+        # the child must be registered before the reaper can see it finish
+        with lock:
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                run_child(request, fds)
+            children[pid] = request['id']
+        for fd in fds:
+            os.close(fd)
+        forked.set()
+        send(sock, send_lock, {'id': request['id'], 'pid': pid})
+
+
+class ForkedProcess:
+    """
+    child forked by the fork server, it mimics the part of Popen used by the engines
+    """
+    def __init__(self, request_id):
+        self.id = request_id
+        self.pid = None
+        self.returncode = None
+        self.usage = None
+        self.stdout = None
+        self.stderr = None
+        self.started = Event()
+        self.exited = Event()
+        self.callbacks = []
+        self.lock = Lock()
+
+    def wait(self):
+        self.exited.wait()
+        return self.returncode
+
+    def add_exit_callback(self, callback):
+        """
+        callback receives the return code, it is called right away if the child has finished already
+        """
+        with self.lock:
+            if not self.exited.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self.returncode)
+
+    def set_exit(self, returncode, usage=None):
+        with self.lock:
+            self.returncode = returncode
+            self.usage = usage
+            self.started.set()
+            self.exited.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(returncode)
+
+
+class ForkServer:
+    """
+    process forked from run_jobs once django and the project settings have been loaded, it forks a child for each
+    python task so they do not pay the interpreter start and django.setup()
+    """
+    def __init__(self):
+        self.sock = None
+        self.pid = None
+        self.processes = {}
+        self.counter = itertools.count()
+        self.lock = Lock()
+        self.send_lock = Lock()
+
+    @property
+    def running(self):
+        return self.sock is not None
+
+    def start(self):
+        """
+        must be called before any thread is started or any database connection is opened
+        """
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            # the children must open their own database connections
+            for conn in connections.all():
+                conn.connection = None
+            for module in ['process.env'] + get_conf('task__forkserver__preload'):
+                try:
+                    importlib.import_module(module)
+                except Exception as e:
+                    logger.exception(f'fork server could not preload {module} due to =>\n{e}')
+            serve(child_sock)
+
+        child_sock.close()
+        self.sock = parent_sock
+        self.pid = pid
+        Thread(target=self.listen, name='django-process-forkserver', daemon=True).start()
+        logger.info(f'fork server started with pid {pid}')
+
+    def listen(self):
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                break
+            message = json.loads(data)
+            with self.lock:
+                process = self.processes.get(message['id'])
+                if 'returncode' in message:
+                    self.processes.pop(message['id'], None)
+            if process is None:
+                continue
+
+            process.pid = message['pid']
+            if 'returncode' in message:
+                process.set_exit(message['returncode'], SimpleNamespace(**message['usage']))
+            else:
+                process.started.set()
+
+        logger.error('fork server has stopped')
+        self.sock = None
+        with self.lock:
+            processes, self.processes = self.processes, {}
+        for process in processes.values():
+            process.set_exit(-1)
+
+    def spawn(self, path, args, limits=None, session=False):
+        """
+        forks a child which runs the python script path with args, limits are applied with setrlimit and session
+        makes the child the leader of a new session as Popen start_new_session
+        :return: ForkedProcess with its stdout and stderr pipes
+        """
+        if not self.running:
+            raise ProcessException('fork server is not running')
+
+        process = ForkedProcess(next(self.counter))
+        out_read, out_write = os.pipe()
+        err_read, err_write = os.pipe()
+        with self.lock:
+            self.processes[process.id] = process
+        request = {'id': process.id, 'path': path, 'args': args, 'limits': limits or {}, 'session': session}
+        try:
+            send(self.sock, self.send_lock, request, [out_write, err_write])
+        except Exception:
+            # the server never got the request so the child will not exist
+            with self.lock:
+                self.processes.pop(process.id, None)
+            os.close(out_read)
+            os.close(err_read)
+            raise
+        finally:
+            os.close(out_write)
+            os.close(err_write)
+
+        process.stdout = os.fdopen(out_read, 'rb')
+        process.stderr = os.fdopen(err_read, 'rb')
+        process.started.wait()
+        if process.pid is None:
+            raise ProcessException('fork server stopped before starting the task')
+        return process
+
+
+forkserver = ForkServer()
@@ -0,0 +1,77 @@
+import os
+import signal
+import logging
+import resource
+from threading import Timer
+
+logger = logging.getLogger('django-process')
+
+
+def rlimits(limits, getrlimit=resource.getrlimit):
+    """
+    :return: (rlimit, (soft, hard)) for each of the resource limits {rlimit name: value}
+    """
+    for name, value in limits.items():
+        rlimit = getattr(resource, name)
+        # the cpu soft limit sends SIGXCPU, the hard one a second later SIGKILL
+        soft, hard = value, value + 1 if rlimit == resource.RLIMIT_CPU else value
+        __, current = getrlimit(rlimit)
+        # unprivileged processes can not raise the hard limit
+        if current != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current), min(hard, current)
+        yield rlimit, (soft, hard)
+
+
+def set_limits(limits):
+    """
+    applies the resource limits {rlimit name: value} in the child before it runs the task
+    """
+    for rlimit, values in rlimits(limits):
+        resource.setrlimit(rlimit, values)
+
+
+def limit_process(pid, limits):
+    """
+    applies the resource limits {rlimit name: value} to the running process pid, only where prlimit exists (linux)
+    """
+    for rlimit, values in rlimits(limits, lambda rlimit: resource.prlimit(pid, rlimit)):
+        resource.prlimit(pid, rlimit, values)
+
+
+def timer(delay, func):
+    t = Timer(delay, func)
+    t.daemon = True
+    t.start()
+    return t
+
+
+class Deadline:
+    """
+    wall clock timeout of a task, when it expires the process group of the task receives SIGTERM and SIGKILL after
+    the grace period, call_later(delay, func) must return an object with cancel() e.g. loop.call_later
+    """
+    def __init__(self, pid, timeout, grace, call_later=timer):
+        self.pid = pid
+        self.timeout = timeout
+        self.grace = grace
+        self.call_later = call_later
+        self.expired = False
+        self.handle = call_later(timeout, self.terminate)
+
+    def signal(self, sig):
+        try:
+            os.killpg(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        logger.error(f'process {self.pid} timed out after {self.timeout} seconds')
+        self.expired = True
+        self.signal(signal.SIGTERM)
+        self.handle = self.call_later(self.grace, self.kill)
+
+    def kill(self):
+        self.signal(signal.SIGKILL)
+
+    def cancel(self):
+        self.handle.cancel()
@@ -0,0 +1,67 @@
+import os
+import logging
+from threading import Lock
+
+from process.conf import get_conf
+
+logger = logging.getLogger('django-process')
+
+
+class TaskOutput:
+    """
+    writes the output of a task instance to its log file while it is produced, the file is rotated when it reaches
+    max_bytes keeping backup_count files and only the last tail_bytes of each stream are kept in memory
+    """
+    def __init__(self, path):
+        self.path = path
+        self.max_bytes = get_conf('task__log__max_bytes')
+        self.backup_count = get_conf('task__log__backup_count')
+        self.tail_bytes = get_conf('task__log__tail_bytes')
+        self.tails = {'stdout': b'', 'stderr': b''}
+        self.truncated = {'stdout': False, 'stderr': False}
+        self.lock = Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # each execution of the task instance starts a new log
+        if os.path.isfile(path):
+            self.rotate()
+        self.file = open(path, 'ab')
+        self.size = 0
+
+    def rotate(self):
+        if not self.backup_count:
+            os.remove(self.path)
+            return
+
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.isfile(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+    def write(self, chunk, stream='stdout'):
+        with self.lock:
+            if self.max_bytes and self.size and self.size + len(chunk) > self.max_bytes:
+                self.file.close()
+                self.rotate()
+                self.file = open(self.path, 'ab')
+                self.size = 0
+
+            self.file.write(chunk)
+            self.file.flush()
+            self.size += len(chunk)
+
+            tail = self.tails[stream] + chunk
+            if len(tail) > self.tail_bytes:
+                tail = tail[-self.tail_bytes:]
+                self.truncated[stream] = True
+            self.tails[stream] = tail
+
+    def tail(self, stream='stdout'):
+        """
+        :return: last tail_bytes of the stream decoded, prefixed with ... if the beginning was discarded
+        """
+        text = self.tails[stream].decode('utf-8', errors='replace')
+        return f'...{text}' if self.truncated[stream] else text
+
+    def close(self):
+        self.file.close()
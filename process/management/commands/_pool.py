@@ -0,0 +1,41 @@
+import os
+import socket
+import logging
+import threading
+
+from process.conf import get_conf
+
+logger = logging.getLogger('django-process')
+
+
+class WorkerPool:
+    """
+    keeps track of the task instances running in this worker so no more than max_workers run at once, the worker
+    identity is recorded in the task instances claimed by it
+    """
+    def __init__(self, max_workers):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.max_workers = max_workers
+        self.running = set()
+        self.lock = threading.Lock()
+
+    @property
+    def free_slots(self):
+        """
+        :return: number of tasks which can be started now or None if it is unlimited
+        """
+        if not self.max_workers:
+            return None
+        with self.lock:
+            return max(self.max_workers - len(self.running), 0)
+
+    def acquire(self, job_task_id):
+        with self.lock:
+            self.running.add(job_task_id)
+
+    def release(self, job_task_id):
+        with self.lock:
+            self.running.discard(job_task_id)
+
+
+pool = WorkerPool(get_conf('task__max_workers'))
@@ -0,0 +1,77 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Avg, F, DurationField, ExpressionWrapper
+from django.utils import timezone
+
+from process.conf import get_conf
+from process.dag import get_dag
+from process.models import JobTask
+
+logger = logging.getLogger('django-process')
+
+# historical mean duration in seconds by process {process_id: (expire date, {task_id: seconds})}
+_durations = {}
+
+
+def get_durations(process_ids):
+    """
+    returns the mean duration in seconds of the finished instances of each task of the processes, they are cached
+    for task__duration_cache seconds
+    """
+    now = timezone.now()
+    missing = [i for i in process_ids if i not in _durations or _durations[i][0] < now]
+    if missing:
+        expire = now + timedelta(seconds=get_conf('task__duration_cache'))
+        for process_id in missing:
+            _durations[process_id] = (expire, {})
+        means = JobTask.objects.filter(
+            task__process_id__in=missing, status=JobTask.finished, dt_start__isnull=False, dt_end__isnull=False
+        ).values('task__process_id', 'task_id').annotate(
+            mean=Avg(ExpressionWrapper(F('dt_end') - F('dt_start'), output_field=DurationField()))
+        )
+        for row in means:
+            _durations[row['task__process_id']][1][row['task_id']] = row['mean'].total_seconds()
+
+    durations = {}
+    for process_id in process_ids:
+        durations.update(_durations[process_id][1])
+    return durations
+
+
+def critical_paths(processes):
+    """
+    returns a function which gives the length in seconds of the longest path from a task to the end of its process,
+    it is the task mean duration plus the longest path of its childs
+    """
+    durations = get_durations([process.id for process in processes])
+    childs = defaultdict(list)
+    for process in processes:
+        childs.update(get_dag(process).childs)
+
+    lengths = {}
+
+    def length(start):
+        # iterative post-order so deep graphs do not reach the recursion limit
+        stack = [start]
+        while stack:
+            node = stack[-1]
+            pending = [c for c in childs[node] if c not in lengths]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            lengths[node] = durations.get(node, 0) + max([lengths[c] for c in childs[node]], default=0)
+        return lengths[start]
+
+    return length
+
+
+def prioritize(ready):
+    """
+    sorts the task instances ready to run by the explicit task priority and then by the critical path so the tasks
+    holding back the end of their jobs start first
+    """
+    ready = list(ready)
+    length = critical_paths(list({t.job.process_id: t.job.process for t in ready}.values()))
+    return sorted(ready, key=lambda t: (-t.task.priority, -length(t.task_id), t.id))
@@ -0,0 +1,100 @@
+import json
+import time
+import logging
+import cProfile
+from collections import deque
+from contextlib import contextmanager
+from django.db import connection
+
+logger = logging.getLogger('django-process')
+
+
+class QueryCounter:
+    """
+    execute wrapper of the connection counting the queries and the time spent on them
+    """
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.time += time.perf_counter() - start
+
+
+def percentile(values, p):
+    # nearest rank of the sorted values
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Profiler:
+    """
+    records the wall time, number of queries and database time of each phase of the run_jobs loop, the last window
+    samples of each phase are kept for the percentiles, cprofile_ticks ticks can be profiled with cProfile too
+    """
+    percentiles = (50, 90, 99)
+
+    def __init__(self, window=1000, cprofile_ticks=0, cprofile_file=None):
+        self.window = window
+        self.phases = {}
+        self.ticks = 0
+        self.cprofile_ticks = cprofile_ticks
+        self.cprofile_file = cprofile_file
+        self.cprofile = cProfile.Profile() if cprofile_ticks else None
+
+    @contextmanager
+    def phase(self, name):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                yield
+        finally:
+            samples = self.phases.setdefault(name, deque(maxlen=self.window))
+            samples.append((time.perf_counter() - start, counter.queries, counter.time))
+
+    @contextmanager
+    def tick(self):
+        profiling = self.cprofile and self.ticks < self.cprofile_ticks
+        if profiling:
+            self.cprofile.enable()
+        try:
+            yield
+        finally:
+            self.ticks += 1
+            if profiling:
+                self.cprofile.disable()
+                if self.ticks == self.cprofile_ticks:
+                    self.cprofile.dump_stats(self.cprofile_file)
+                    logger.info(f'cProfile of {self.ticks} ticks written to {self.cprofile_file}')
+
+    def report(self):
+        """
+        :return: percentiles of the wall time, queries and database time of each phase
+        """
+        report = {'ticks': self.ticks, 'phases': {}}
+        for name, samples in self.phases.items():
+            samples = list(samples)
+            columns = dict(zip(('wall', 'queries', 'db'), (sorted(column) for column in zip(*samples))))
+            report['phases'][name] = {
+                'samples': len(samples),
+                **{
+                    column: {
+                        **{f'p{p}': percentile(values, p) for p in self.percentiles},
+                        'max': values[-1],
+                        'total': sum(values),
+                    }
+                    for column, values in columns.items()
+                }
+            }
+        return report
+
+    def dump(self, stream=None):
+        text = json.dumps(self.report(), indent=2)
+        logger.info(f'run_jobs profile\n{text}')
+        if stream:
+            stream.write(text)
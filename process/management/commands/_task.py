@@ -1,77 +1,291 @@
 import os
 import sys
+import time
+import signal
 import logging
+import resource
+import selectors
 import subprocess
+from functools import partial
 from threading import Thread
-from django.utils import timezone
 
+from process import metrics
 from process.conf import get_conf
-from process.models import Job, JobTask
+from process.models import Job, JobTask, JobTaskUsage
+from ._code_cache import code_cache
+from ._forkserver import forkserver, ForkedProcess
+from ._limits import set_limits, limit_process, timer, Deadline
+from ._output import TaskOutput
+from ._pool import pool
+from ._wakeup import wakeup
 logger = logging.getLogger('django-process')
 
 
-class TaskThreaded(Thread):
-    def __init__(self, obj, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+def wait(p):
+    """
+    waits the child like Popen.wait but with os.wait4 so its resource usage is returned along with the return code
+    """
+    if isinstance(p, ForkedProcess):
+        return p.wait(), p.usage
+    __, status, usage = os.wait4(p.pid, 0)
+    p.returncode = os.waitstatus_to_exitcode(status)
+    return p.returncode, usage
+
+
+def exited(p, timeout):
+    """
+    :return: True if the child finishes within timeout seconds, it is not reaped so wait(p) still gets its usage
+    """
+    if isinstance(p, ForkedProcess):
+        return p.exited.wait(timeout)
+    limit = time.monotonic() + timeout
+    while not os.waitid(os.P_PID, p.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT):
+        remaining = limit - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(remaining, 0.05))
+    return True
+
+
+class Alarm:
+    """
+    function called by the thread of a task once when is reached, unless it is cancelled before
+    """
+    def __init__(self, when, func):
+        self.when = when
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def signal_name(signum):
+    try:
+        return signal.Signals(signum).name
+    except ValueError:
+        return str(signum)
+
+
+class TaskRunner:
+    """
+    common behaviour of the execution engines, the task instance must have been claimed by this worker before the
+    runner is created, the engine only has to execute the command and report the pid and the outcome
+    """
+    def __init__(self, obj):
         self.obj = obj
-        self.obj.status = JobTask.initialized
-        self.obj.save()
+        self.output = None
+        self.deadline = None
+        self.usage = None
+        self.code_path = None
+        pool.acquire(self.obj.id)
 
-    def run(self):
-        try:
+    @property
+    def forked(self):
+        """
+        python tasks with the default interpreter run in the fork server when it is enabled
+        """
+        return forkserver.running and not self.obj.task.interpreter and self.obj.task.file_extension == 'py'
+
+    @property
+    def limits(self):
+        """
+        :return: resource limits of the task applied in the child {rlimit name: value}
+        """
+        task = self.obj.task
+        limits = {
+            'RLIMIT_CPU': task.cpu_limit,
+            'RLIMIT_AS': task.memory_limit and task.memory_limit * 1024 * 1024,
+            'RLIMIT_NOFILE': task.nofile_limit,
+        }
+        return {name: value for name, value in limits.items() if value}
+
+    @property
+    def session(self):
+        # tasks with timeout run in their own session so the whole process group can be killed
+        return bool(self.obj.task.timeout)
+
+    def popen(self, cmd):
+        """
+        starts the task as a new process, the limits are applied with prlimit right after the spawn since preexec_fn
+        is not safe with threads and it disables the vfork fast path, only without prlimit (macOS) preexec_fn is used
+        """
+        limits = self.limits
+        prlimit = limits and hasattr(resource, 'prlimit')
+        p = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=self.session,
+            preexec_fn=partial(set_limits, limits) if limits and not prlimit else None
+        )
+        if prlimit:
             try:
-                # get interpreter the default is the one used to run django
-                if not self.obj.task.interpreter:
-                    cmd = [sys.executable]
-                else:
-                    cmd = self.obj.task.interpreter.split()
-
-                # noinspection SpellCheckingInspection
-                if self.obj.task.code.file.__class__.__name__ == 'S3Boto3StorageFile':
-                    if not os.path.isdir('/tmp/dj_process_tasks'):
-                        os.makedirs('/tmp/dj_process_tasks')
-                    file_path = os.path.join('/tmp', self.obj.task.code.file.name)
-                    if not os.path.isfile(file_path):
-                        with open(file_path, 'wb') as code:
-                            code.write(self.obj.task.code.file.read())
-                else:
-                    file_path = self.obj.task.code.path
+                limit_process(p.pid, limits)
+            except ProcessLookupError:
+                pass
+            except Exception:
+                # the task must not run without its limits
+                p.kill()
+                p.wait()
+                raise
+        return p
 
-                # append task file path and arguments if they exists
-                cmd.append(file_path)
-                if self.obj.task.arguments:
-                    cmd += self.obj.task.arguments.split()
+    def get_command(self):
+        # get interpreter the default is the one used to run django
+        if not self.obj.task.interpreter:
+            cmd = [sys.executable]
+        else:
+            cmd = self.obj.task.interpreter.split()
 
-                logger.info(f'command to execute {cmd}')
+        # remote storages are copied to the local code cache
+        file_path = self.code_path = code_cache.get_path(self.obj.task.code)
 
-                # executing the task and save the PID
-                p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                self.obj.pid = p.pid
-                self.obj.save()
+        # append task file path and arguments if they exists
+        cmd.append(file_path)
+        if self.obj.task.arguments:
+            cmd += self.obj.task.arguments.split()
+
+        logger.info(f'command to execute {cmd}')
+        return cmd
+
+    def watch(self, pid, call_later=timer):
+        # start the wall clock timeout of the task if it has one
+        if self.obj.task.timeout:
+            self.deadline = Deadline(pid, self.obj.task.timeout, get_conf('task__kill_grace'), call_later)
+
+    def unwatch(self):
+        # must be called from the same thread as watch once the process has finished
+        if self.deadline:
+            self.deadline.cancel()
+
+    def started(self, pid):
+        # save the PID of the task and start streaming its output to the log file
+        self.obj.pid = pid
+        JobTask.objects.filter(pk=self.obj.pk).update(pid=pid)
+        self.output = TaskOutput(self.obj.log_path)
 
-                # communicate to PID to get the standard output and error
-                stdout, stderr = p.communicate()
+    def finished(self, returncode, usage=None):
+        # return code must be 0 for success, only the tail of the output is kept in the observations
+        self.usage = usage
+        self.obj.observations = self.output.tail('stdout')
+        if self.deadline and self.deadline.expired:
+            raise Exception(f"timed out after {self.obj.task.timeout} seconds\n{self.output.tail('stderr')}")
+        if returncode < 0:
+            raise Exception(f"killed by signal {signal_name(-returncode)}\n{self.output.tail('stderr')}")
+        if returncode:
+            raise Exception(self.output.tail('stderr'))
 
-                # return code must be 0 for success
-                self.obj.observations = stdout.decode('utf-8')
-                if p.returncode:
-                    raise Exception(stderr.decode('utf-8'))
+        self.obj.status = JobTask.finished
 
-                self.obj.status = JobTask.finished
+    def failed(self, e):
+        # if error then send to logger and also mark task and it's job as error
+        self.obj.observations += f"\nexception when running task {e}"
+        self.obj.status = JobTask.error
+        self.obj.job.status = Job.error
+        logger.error(f'task {self.obj} finished with error {self.obj.observations}')
+        Job.objects.filter(pk=self.obj.job_id, status=Job.initialized).update(status=Job.error)
+        # if there is a custom handler send task id and exception to it
+        error_handler_func = get_conf('task__error_handler')
+        logger.info(f'sending info to handler {error_handler_func.__name__}')
+        error_handler_func(self.obj, e)
+
+    def close(self):
+        if self.output:
+            self.output.close()
+        # only the outcome columns are written and only if nobody changed the task instance meanwhile
+        if not self.obj.transition(self.obj.status, expected=JobTask.initialized, observations=self.obj.observations):
+            logger.error(f'task {self.obj} is not initialized anymore its outcome {self.obj.status} is discarded')
+            return
+
+        if self.usage:
+            try:
+                JobTaskUsage.record(self.obj, self.usage)
+            except Exception as e:
+                logger.exception(f'resource usage of task {self.obj} could not be saved due to =>\n{e}')
+        metrics.task_transitions.inc(status=self.obj.status)
+        metrics.task_duration.observe(
+            (self.obj.dt_end - self.obj.dt_start).total_seconds(),
+            process=self.obj.job.process.name, task=self.obj.task.name
+        )
+
+    def release(self):
+        # free the slot and let the dispatcher start the next tasks right away
+        if self.code_path:
+            code_cache.release(self.code_path)
+        pool.release(self.obj.id)
+        wakeup.notify(self.obj.id)
+
+
+class TaskThreaded(TaskRunner, Thread):
+    """
+    default engine, each task instance is supervised by its own thread which reads both pipes and also runs the
+    timeout alarms so no other thread is needed
+    """
+    def __init__(self, obj, *args, **kwargs):
+        Thread.__init__(self, *args, **kwargs)
+        TaskRunner.__init__(self, obj)
+        self.alarms = []
+
+    def call_later(self, delay, func):
+        alarm = Alarm(time.monotonic() + delay, func)
+        self.alarms.append(alarm)
+        return alarm
+
+    def next_alarm(self):
+        """
+        :return: seconds until the next alarm or None if there is none pending
+        """
+        self.alarms = [alarm for alarm in self.alarms if not alarm.cancelled]
+        if not self.alarms:
+            return None
+        return max(min(alarm.when for alarm in self.alarms) - time.monotonic(), 0)
+
+    def fire_alarms(self):
+        now = time.monotonic()
+        for alarm in [alarm for alarm in self.alarms if not alarm.cancelled and alarm.when <= now]:
+            alarm.cancel()
+            alarm.func()
+
+    def pump(self, p):
+        # the output is read as communicate does, multiplexing both pipes in this thread
+        with selectors.DefaultSelector() as selector:
+            selector.register(p.stdout, selectors.EVENT_READ, 'stdout')
+            selector.register(p.stderr, selectors.EVENT_READ, 'stderr')
+            while selector.get_map():
+                for key, __ in selector.select(self.next_alarm()):
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        self.output.write(chunk, key.data)
+                    else:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                self.fire_alarms()
+
+        # the child may still be running after closing its output, the deadline must keep working meanwhile
+        while self.next_alarm() is not None and not exited(p, self.next_alarm()):
+            self.fire_alarms()
+
+    def run(self):
+        try:
+            try:
+                cmd = self.get_command()
+
+                # executing the task and save the PID
+                if self.forked:
+                    p = forkserver.spawn(cmd[1], cmd[2:], self.limits, self.session)
+                else:
+                    p = self.popen(cmd)
+                self.watch(p.pid, self.call_later)
+                self.started(p.pid)
+
+                self.pump(p)
+                returncode, usage = wait(p)
+                self.unwatch()
+                self.finished(returncode, usage)
 
             except Exception as e:
-                # if error then send to logger and also mark task and it's job as error
-                self.obj.observations += f"\nexception when running task {e}"
-                self.obj.status = JobTask.error
-                self.obj.job.status = Job.error
-                logger.error(f'task {self.obj} finished with error {self.obj.observations}')
-                self.obj.job.save()
-                # if there is a custom handler send task id and exception to it
-                error_handler_func = get_conf('task__error_handler')
-                logger.info(f'sending info to handler {error_handler_func.__name__}')
-                error_handler_func(self.obj, e)
-
-            self.obj.dt_end = timezone.now()
-            self.obj.save()
+                self.failed(e)
+
+            self.close()
         except Exception as e:
             logger.exception(f'error {e} when processing task {self.obj}')
+        finally:
+            self.release()
@@ -0,0 +1,35 @@
+import queue
+import logging
+
+logger = logging.getLogger('django-process')
+
+
+class Wakeup:
+    """
+    in-process queue used to wake up the dispatcher loop as soon as the state changes e.g. a task has finished
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def notify(self, reason=None):
+        self.queue.put(reason)
+
+    def wait(self, timeout):
+        """
+        blocks until notified or timeout, all the pending notifications are consumed so a burst of them is handled
+        in a single dispatch
+        :return: list of reasons received, empty on timeout
+        """
+        try:
+            reasons = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while True:
+            try:
+                reasons.append(self.queue.get_nowait())
+            except queue.Empty:
+                return reasons
+
+
+wakeup = Wakeup()
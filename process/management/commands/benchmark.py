@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+import logging
+import platform
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+import process
+from process.benchmark import startup, scheduler, dispatch
+from ._actions import configure_env
+
+logger = logging.getLogger('django-process')
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a django-process benchmark and print the results as json, scheduler and dispatch create synthetic '
+        'processes and run their jobs so use a database dedicated to benchmarking'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['startup', 'scheduler', 'dispatch'])
+        parser.add_argument('--runs', type=int, default=10, help='startup: interpreters started per variant')
+        parser.add_argument('--apps', nargs='*', default=None, help='startup: apps loaded in lite mode')
+        parser.add_argument('--processes', type=int, default=None, help='synthetic processes created')
+        parser.add_argument('--width', type=int, default=5, help='tasks on each level of the processes')
+        parser.add_argument('--depth', type=int, default=3, help='levels of the processes')
+        parser.add_argument('--timeout', type=int, default=300, help='dispatch: seconds to wait for the jobs')
+        parser.add_argument('--keep', action='store_true', help='do not delete the synthetic processes')
+        parser.add_argument(
+            '--manage', default=sys.argv[0], help='dispatch: manage.py used to start run_jobs, the running one by default'
+        )
+
+    def handle(self, *args, **options):
+        suite = options['suite']
+        workload = {'width': options['width'], 'depth': options['depth'], 'keep': options['keep']}
+        if options['processes'] is not None:
+            workload['processes'] = options['processes']
+
+        # the tasks and the startup variants read the file run_jobs writes
+        configure_env()
+        if suite == 'dispatch' and not os.path.isfile(options['manage']):
+            raise CommandError(f"manage.py not found at {options['manage']}, set it with --manage")
+        if suite == 'startup':
+            parameters = {'runs': options['runs'], 'apps': options['apps']}
+            results = startup.run(**parameters)
+        elif suite == 'scheduler':
+            parameters = workload
+            results = scheduler.run(**parameters)
+        else:
+            parameters = {**workload, 'timeout': options['timeout']}
+            results = dispatch.run(os.path.abspath(options['manage']), **parameters)
+
+        self.stdout.write(json.dumps({
+            'suite': suite,
+            'parameters': parameters,
+            'environment': {
+                'django_process': process.__version__,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'platform': sys.platform,
+                'database': connection.vendor,
+            },
+            'results': results,
+        }, indent=2))
@@ -1,35 +1,131 @@
+import os
 import time
+import signal
 import logging
+from datetime import timedelta
+from threading import Thread
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from ._actions import configure_env, run_jobs, run_awaiting_tasks, finish_jobs
+from process import metrics
+from process.conf import get_conf
+from process.models import Lease
+from process.notifications import get_notification_backend
+from ._actions import configure_env, schedule_processes, run_jobs, run_awaiting_tasks, finish_jobs, recover_orphans
+from ._forkserver import forkserver
+from ._pool import pool
+from ._profile import Profiler
+from ._wakeup import wakeup
 
 logger = logging.getLogger('django-process')
 
 
+def listen_notifications(backend):
+    try:
+        backend.listen(wakeup.notify)
+    except Exception as e:
+        logger.exception(f'notification backend {backend.__class__.__name__} stopped listening due to =>\n{e}')
+
+
 class Command(BaseCommand):
     help = 'Run All Jobs'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', type=float, default=0, metavar='SECONDS',
+            help='write the phases profile every SECONDS, it is also written on SIGUSR1 and when run_jobs stops'
+        )
+        parser.add_argument('--cprofile', type=int, default=0, metavar='TICKS', help='profile TICKS with cProfile')
+        parser.add_argument('--cprofile-file', default=f'run_jobs-{os.getpid()}.prof')
+
     # noinspection PyMethodMayBeStatic
     def handle(self, *args, **options):
         logger.info('django-process run_jobs started')
+        profiler = Profiler(cprofile_ticks=options['cprofile'], cprofile_file=options['cprofile_file'])
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.dump(self.stdout))
         configure_env()
+        # the fork server is forked before any thread or database connection exists
+        if get_conf('task__forkserver__enabled'):
+            forkserver.start()
+
+        backend = get_notification_backend()
+        if backend:
+            Thread(target=listen_notifications, args=(backend,), daemon=True).start()
+
+        min_interval = get_conf('dispatcher__min_interval')
+        heartbeat = get_conf('dispatcher__heartbeat')
+        lease_ttl = get_conf('scheduler__lease_ttl')
+        orphans_interval = get_conf('task__orphans__interval')
+        metrics_interval = get_conf('metrics__interval')
+        profile_interval = options['profile']
         try:
-            # This var will prevent many jobs started from the same process in the 0 second
-            jobs_start_unlocked = False
+            # only the worker holding the scheduler lease creates the jobs, the others just run tasks
+            leader = False
+            renew_lease = timezone.now()
+            # date when the next process is due, run_jobs only queries the processes due at that moment
+            next_run = timezone.now()
+            # orphans are looked for right after the first lease renewal
+            next_recovery = timezone.now()
+            next_metrics = timezone.now()
+            next_profile = timezone.now() + timedelta(seconds=profile_interval)
+            interval = min_interval
             while True:
-                time.sleep(0.1)
-
+                tick = time.perf_counter()
                 now = timezone.now()
-                if now.second == 0 and jobs_start_unlocked:
-                    jobs_start_unlocked = False
-                    run_jobs(now)
-                elif now.second != 0:
-                    jobs_start_unlocked = True
+                with profiler.tick():
+                    if now >= renew_lease:
+                        with profiler.phase('lease'):
+                            was_leader = leader
+                            # the worker lease tells the other workers this one is alive
+                            Lease.acquire(Lease.worker(pool.worker), pool.worker, lease_ttl)
+                            leader = Lease.acquire(Lease.scheduler, pool.worker, lease_ttl)
+                            renew_lease = now + timedelta(seconds=lease_ttl / 3)
+                            if leader and not was_leader:
+                                logger.info(f'worker {pool.worker} is now the scheduler leader')
+                                next_run = now
+                            elif was_leader and not leader:
+                                logger.error(f'worker {pool.worker} lost the scheduler lease')
+
+                    if leader:
+                        with profiler.phase('run_jobs'):
+                            # processes stored without save() (loaddata, bulk_create, update) have no next run yet
+                            if schedule_processes(now):
+                                next_run = now
+                            if now >= next_run:
+                                next_run = run_jobs(now)
+
+                    if now >= next_recovery:
+                        with profiler.phase('recover_orphans'):
+                            recover_orphans()
+                        next_recovery = now + timedelta(seconds=orphans_interval)
+
+                    with profiler.phase('run_awaiting_tasks'):
+                        started = run_awaiting_tasks()
+                    with profiler.phase('finish_jobs'):
+                        finished = finish_jobs()
+
+                metrics.tick_seconds.observe(time.perf_counter() - tick)
+                if now >= next_metrics:
+                    metrics.registry.dump(pool.worker)
+                    next_metrics = now + timedelta(seconds=metrics_interval)
+                if profile_interval and now >= next_profile:
+                    profiler.dump(self.stdout)
+                    next_profile = now + timedelta(seconds=profile_interval)
 
-                run_awaiting_tasks()
-                finish_jobs()
+                # keep dispatching quickly while there is activity otherwise back off up to the heartbeat
+                interval = min_interval if started or finished else min(interval * 2, heartbeat)
+                wake_at = min(next_run, renew_lease) if leader else renew_lease
+                timeout = min(interval, max((wake_at - timezone.now()).total_seconds(), 0))
+                reasons = wakeup.wait(timeout)
+                if reasons:
+                    logger.debug(f'dispatcher woken up by {reasons}')
 
         except KeyboardInterrupt:
             pass
+        finally:
+            if profile_interval:
+                profiler.dump(self.stdout)
+            Lease.release(Lease.scheduler, pool.worker)
+            Lease.release(Lease.worker(pool.worker), pool.worker)
+            if os.path.isfile(metrics.snapshot_path(pool.worker)):
+                os.remove(metrics.snapshot_path(pool.worker))
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from bisect import bisect_left
+from threading import Lock
+from django.conf import settings
+
+from process.conf import get_conf
+
+logger = logging.getLogger('django-process')
+
+"""
+in process metrics of run_jobs without external dependencies, each worker dumps a snapshot of its registry to the
+metrics directory from time to time and the metrics view renders all the snapshots in prometheus text format
+"""
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self):
+        with self.lock:
+            samples = [[list(key), value] for key, value in self.values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labels': list(self.labels), 'samples': samples}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=None):
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets or get_conf('metrics__buckets'))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # counts of each bucket (not cumulative) plus the +Inf one, sum
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot['buckets'] = self.buckets
+        return snapshot
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def dump(self, worker):
+        """
+        writes the snapshot of this worker to the metrics directory, the file is replaced atomically
+        """
+        directory = get_metrics_dir()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'worker': worker, 'metrics': self.snapshot()}, f)
+            os.replace(tmp, snapshot_path(worker))
+        except OSError as e:
+            logger.error(f'metrics could not be written to {directory} due to => {e}')
+
+
+def get_metrics_dir():
+    return get_conf('metrics__dir') or os.path.join(settings.BASE_DIR, 'dj_process_metrics')
+
+
+def snapshot_path(worker):
+    return os.path.join(get_metrics_dir(), f'{worker}.json')
+
+
+def load_snapshots():
+    """
+    :return: snapshots of the workers which have written one recently
+    """
+    directory = get_metrics_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    snapshots = []
+    oldest = time.time() - get_conf('metrics__stale')
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json'):
+            continue
+        try:
+            if os.path.getmtime(path) < oldest:
+                continue
+            with open(path, 'r') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.debug(f'metrics snapshot {path} skipped due to => {e}')
+    return snapshots
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(snapshots):
+    """
+    :return: the snapshots of all the workers in prometheus text exposition format, each sample has a worker label
+    """
+    families = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot['metrics'].items():
+            family = families.setdefault(name, {**metric, 'samples': []})
+            family['samples'] += [(snapshot['worker'], key, value) for key, value in metric['samples']]
+
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        names = ['worker'] + family['labels']
+        for worker, key, value in family['samples']:
+            values = [worker] + key
+            if family['type'] != 'histogram':
+                lines.append(f'{name}{labels_text(names, values)} {value}')
+                continue
+
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(family['buckets'] + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{labels_text(names, values, [('le', bound)])} {cumulative}")
+            lines.append(f'{name}_sum{labels_text(names, values)} {total}')
+            lines.append(f'{name}_count{labels_text(names, values)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+tick_seconds = registry.register(Histogram(
+    'django_process_tick_seconds', 'duration of the run_jobs loop iterations'
+))
+ready_tasks = registry.register(Gauge(
+    'django_process_ready_tasks', 'task instances ready to run in the last dispatch'
+))
+running_tasks = registry.register(Gauge(
+    'django_process_running_tasks', 'task instances running in the worker slots'
+))
+task_start_latency = registry.register(Histogram(
+    'django_process_task_start_latency_seconds', 'seconds since a task instance was ready until it was initialized',
+    labels=('process',)
+))
+task_duration = registry.register(Histogram(
+    'django_process_task_duration_seconds', 'duration of the task instances', labels=('process', 'task')
+))
+task_transitions = registry.register(Counter(
+    'django_process_task_transitions_total', 'status transitions of the task instances done by run_jobs',
+    labels=('status',)
+))
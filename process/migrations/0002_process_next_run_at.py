@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='next run'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0002_process_next_run_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='max_parallel',
+            field=models.PositiveIntegerField(default=0, verbose_name='max tasks running at once (0 unlimited)'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='max_parallel',
+            field=models.PositiveIntegerField(default=0, verbose_name='max instances running at once (0 unlimited)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0003_max_parallel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobtask',
+            name='worker',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='worker'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0004_jobtask_worker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='name')),
+                ('holder', models.CharField(max_length=100, verbose_name='holder')),
+                ('dt_heartbeat', models.DateTimeField(verbose_name='heartbeat date')),
+                ('dt_expire', models.DateTimeField(verbose_name='expire date')),
+            ],
+            options={
+                'verbose_name': 'lease',
+                'verbose_name_plural': 'leases',
+                'db_table': 'pr_leases',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0006_task_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='dag_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='tasks graph version'),
+        ),
+    ]
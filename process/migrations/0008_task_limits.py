@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0007_process_dag_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='cpu_limit',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='cpu time limit in seconds'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='memory_limit',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='memory limit in MB'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='nofile_limit',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='open files limit'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='timeout',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='timeout in seconds'),
+        ),
+    ]
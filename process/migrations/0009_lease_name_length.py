@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0008_task_limits'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lease',
+            name='name',
+            field=models.CharField(max_length=150, unique=True, verbose_name='name'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0009_lease_name_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobTaskUsage',
+            fields=[
+                ('job_task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='process.jobtask', verbose_name='job task')),
+                ('user_time', models.FloatField(verbose_name='user cpu seconds')),
+                ('system_time', models.FloatField(verbose_name='system cpu seconds')),
+                ('max_rss', models.PositiveBigIntegerField(verbose_name='max resident memory in bytes')),
+                ('block_input', models.PositiveBigIntegerField(verbose_name='block input operations')),
+                ('block_output', models.PositiveBigIntegerField(verbose_name='block output operations')),
+                ('voluntary_switches', models.PositiveBigIntegerField(verbose_name='voluntary context switches')),
+                ('involuntary_switches', models.PositiveBigIntegerField(verbose_name='involuntary context switches')),
+            ],
+            options={
+                'verbose_name': 'job task usage',
+                'verbose_name_plural': 'job task usages',
+                'db_table': 'pr_job_task_usage',
+            },
+        ),
+    ]
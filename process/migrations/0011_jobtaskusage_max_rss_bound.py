@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process', '0010_jobtaskusage'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='jobtaskusage',
+            old_name='max_rss',
+            new_name='max_rss_bound',
+        ),
+        migrations.AlterField(
+            model_name='jobtaskusage',
+            name='max_rss_bound',
+            field=models.PositiveBigIntegerField(verbose_name='max resident memory upper bound in bytes'),
+        ),
+    ]
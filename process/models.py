@@ -1,16 +1,28 @@
 import re
 import os
+import sys
 import logging
+from datetime import timedelta
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, FileExtensionValidator
-from django.db import models, transaction, DatabaseError
+from django.db import models, transaction, connection, DatabaseError, IntegrityError
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
+from process.conf import get_conf
 from process.exceptions import ProcessException
+from process.notifications import notify_change
 logger = logging.getLogger('django-process')
 
+# crontab fields in the same order they are compiled by Process.schedule
+CRON_FIELDS = ('minute', 'hour', 'day_of_month', 'month', 'day_of_week')
+
+# compiled schedules by process id {pk: (crontab fields, bitmasks)}
+_schedules = {}
+
 
 # noinspection SpellCheckingInspection
 class Process(models.Model):
@@ -28,6 +40,9 @@ class Process(models.Model):
     month = models.CharField(_("month"), max_length=50)
     day_of_week = models.CharField(_("day of week"), max_length=50)
     chart_height = models.PositiveIntegerField(_("chart height"), default=0)
+    max_parallel = models.PositiveIntegerField(_("max tasks running at once (0 unlimited)"), default=0)
+    next_run_at = models.DateTimeField(_("next run"), blank=True, null=True, editable=False, db_index=True)
+    dag_version = models.PositiveIntegerField(_("tasks graph version"), default=0, editable=False)
     objects = models.Manager()
 
     def __str__(self):
@@ -53,6 +68,13 @@ class Process(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        _schedules.pop(self.pk, None)
+        self.next_run_at = self.next_run(timezone.now())
+        if not self._state.adding and not kwargs.get('force_insert') and 'update_fields' not in kwargs:
+            # the graph version is only changed by process.dag.bump_dag_version so a stale instance can't undo it
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'dag_version'
+            ]
         return super().save(*args, **kwargs)
 
     @staticmethod
@@ -115,35 +137,64 @@ class Process(models.Model):
         # the set is complete
         return n3
 
-    def _minute(self):
-        validation = self.current_time.minute in self._expanded(self.minute, 'minute')
-        return any([self.minute == '*', validation])
-
-    def _hour(self):
-        validation = self.current_time.hour in self._expanded(self.hour, 'hour')
-        return any([self.hour == '*', validation])
-
-    def _day_of_month(self):
-        validation = self.current_time.day in self._expanded(self.day_of_month, 'day_of_month')
-        return any([self.day_of_month == '*', validation])
+    @classmethod
+    def _bitmask(cls, var, type_val):
+        """
+        compiles a crontab like string into an integer where each allowed value is a bit set example
+        '1,3-5' will be compiled to 0b111010, a star matches anything so all bits are set
+        :return: integer bitmask
+        """
+        if var == '*':
+            return ~0
+        return sum(1 << i for i in cls._expanded(var, type_val))
 
-    def _month(self):
-        validation = self.current_time.month in self._expanded(self.month, 'month')
-        return any([self.month == '*', validation])
+    def schedule(self):
+        """
+        returns the crontab fields compiled as bitmasks (minute, hour, day_of_month, month, day_of_week)
+        they are cached by process id and only compiled again if the crontab fields have changed
+        """
+        source = (self.minute, self.hour, self.day_of_month, self.month, self.day_of_week)
+        cached = _schedules.get(self.pk)
+        if cached and cached[0] == source:
+            return cached[1]
 
-    def _day_of_week(self):
-        iso_week = self.current_time.isoweekday()
-        validation = iso_week in self._expanded(self.day_of_week, 'day_of_week')
-        return any([self.day_of_week == '*', validation])
+        masks = tuple(self._bitmask(var, type_val) for var, type_val in zip(source, CRON_FIELDS))
+        if self.pk:
+            _schedules[self.pk] = (source, masks)
+        return masks
 
     def must_run(self, date):
         """
         This method is used to check if the Job should be executed by time
         :return: Boolean
         """
-        # noinspection PyAttributeOutsideInit
-        self.current_time = date
-        return all([self._minute(), self._hour(), self._day_of_month(), self._month(), self._day_of_week()])
+        minute, hour, day_of_month, month, day_of_week = self.schedule()
+        return bool(
+            (minute >> date.minute) & (hour >> date.hour) & (day_of_month >> date.day) &
+            (month >> date.month) & (day_of_week >> date.isoweekday()) & 1
+        )
+
+    def next_run(self, date):
+        """
+        returns the first minute after date when the Job should be executed, instead of checking minute by minute
+        it jumps to the next month, day or hour when the current one does not match
+        :return: datetime or None if the crontab fields never match
+        """
+        minute, hour, day_of_month, month, day_of_week = self.schedule()
+        date = date.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = date + timedelta(days=366 * 4)
+        while date < limit:
+            if not (month >> date.month) & 1:
+                date = (date.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not (day_of_month >> date.day) & (day_of_week >> date.isoweekday()) & 1:
+                date = (date + timedelta(days=1)).replace(hour=0, minute=0)
+            elif not (hour >> date.hour) & 1:
+                date = (date + timedelta(hours=1)).replace(minute=0)
+            elif not (minute >> date.minute) & 1:
+                date += timedelta(minutes=1)
+            else:
+                return date
+        return None
 
 
 # noinspection SpellCheckingInspection
@@ -163,6 +214,12 @@ class Task(models.Model):
     offset = models.CharField(_("diagram offset"), max_length=5, default='0%', validators=[offset_validator])
     interpreter = models.CharField(_("interpreter"), max_length=50, blank=True, null=True)
     arguments = models.CharField(_("arguments"), max_length=500, blank=True, null=True)
+    max_parallel = models.PositiveIntegerField(_("max instances running at once (0 unlimited)"), default=0)
+    priority = models.IntegerField(_("priority (higher starts first)"), default=0)
+    timeout = models.PositiveIntegerField(_("timeout in seconds"), blank=True, null=True)
+    cpu_limit = models.PositiveIntegerField(_("cpu time limit in seconds"), blank=True, null=True)
+    memory_limit = models.PositiveIntegerField(_("memory limit in MB"), blank=True, null=True)
+    nofile_limit = models.PositiveIntegerField(_("open files limit"), blank=True, null=True)
     code = models.FileField(
         _("code file"),
         upload_to='dj_process_tasks/',
@@ -217,14 +274,25 @@ class TaskDependence(models.Model):
 
     def clean(self):
         super().clean()
+        TaskDependence.check_cycles(self.task, [self.parent])
 
-        def parent_recursive(task, parent):
-            if parent == task:
-                raise ValidationError(_('cyclic relation detected'))
-            for p in parent.parents.all():
-                parent_recursive(task, p.parent)
+    @staticmethod
+    def cyclic_parents(task, parents):
+        """
+        the dependencies of the process are loaded once and all the parents are checked in memory
+        :return: ids of the new parents which would close a cycle, the task itself or any of its descendants
+        """
+        from process.dag import ProcessDAG
+        parent_ids = {parent.id for parent in parents}
+        return parent_ids & (ProcessDAG.load(task.process_id).descendants(task.id) | {task.id})
 
-        parent_recursive(self.task, self.parent)
+    @staticmethod
+    def check_cycles(task, parents):
+        """
+        raises ValidationError if any of the new parents is the task itself or one of its descendants
+        """
+        if TaskDependence.cyclic_parents(task, parents):
+            raise ValidationError(_('cyclic relation detected'))
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -289,12 +357,13 @@ class Job(models.Model):
         not create any task, example the time has come for start a job but a previous instance is still running and the
         process it's configured for not overlap the new instance will be created as finished
         """
-        job = cls(process=process, *args, **kwargs)
-        job.save()
-        ret_tasks = []
-        if job.status != 'finished':
-            tasks = Task.objects.filter(is_active=True, process=process).order_by('level')
-            ret_tasks = [JobTask.create(job, t) for t in tasks]
+        with transaction.atomic():
+            job = cls(process=process, *args, **kwargs)
+            job.save()
+            ret_tasks = []
+            if job.status != 'finished':
+                tasks = Task.objects.filter(is_active=True, process=process).order_by('level')
+                ret_tasks = JobTask.create_bulk(job, tasks)
         return job, ret_tasks
 
     def cancel(self):
@@ -367,6 +436,7 @@ class JobTask(models.Model):
     )
     status = models.CharField(_("status"), db_index=True, max_length=20, choices=status_choices, default=awaiting)
     pid = models.PositiveIntegerField(_("pid"), default=0, db_index=True)
+    worker = models.CharField(_("worker"), max_length=100, blank=True, null=True)
     dt_created = models.DateTimeField(_("created date"), blank=True, null=True, auto_now_add=True)
     dt_start = models.DateTimeField(_("start date"), blank=True, null=True)
     dt_end = models.DateTimeField(_("end date"), blank=True, null=True)
@@ -410,61 +480,147 @@ class JobTask(models.Model):
         else:
             return self.task.description
 
+    @property
+    def log_path(self):
+        """
+        file where the output of the task instance is written, see task__log settings
+        """
+        log_dir = get_conf('task__log__dir') or os.path.join(settings.BASE_DIR, 'dj_process_logs')
+        return os.path.join(log_dir, str(self.job_id), f'{self.id}.log')
+
     @property
     def ready_to_run(self):
         return all([p.status in JobTask.ok_status for p in self.get_parents()])
 
+    @classmethod
+    def ready(cls):
+        """
+        returns the task instances ready to run of all the unfinished jobs in a single query, the ones waiting for
+        a parent which is not in ok_status are excluded
+        """
+        pending_parents = cls.objects.filter(
+            job=OuterRef('job'), task__childs__task=OuterRef('task')
+        ).exclude(status__in=cls.ok_status)
+        return cls.objects.filter(
+            status__in=cls.run_status, job__status__in=Job.unfinished
+        ).exclude(Exists(pending_parents)).select_related('job', 'job__process', 'task')
+
     @classmethod
     def create(cls, job, task):
         task = cls(job=job, task=task)
         task.save()
         return task
 
-    def get_childs(self):
-        return JobTask.objects.filter(
-            job=self.job,
-            task__in=TaskDependence.objects.filter(parent=self.task).values('task')
-        )
-
-    def get_parents(self):
-        return JobTask.objects.filter(
-            job=self.job,
-            task__in=TaskDependence.objects.filter(task=self.task).values('parent')
-        )
-
-    def reopen(self, main=None):
-        if main and self.status not in JobTask.can_reopen:
-            raise ValidationError(
-                {'status': _("can't reopen current status not valid")}
-            )
-
-        self.status = JobTask.reopened if main else JobTask.awaiting
-        self.save()
+    @classmethod
+    def create_bulk(cls, job, tasks):
+        """
+        creates the task instances of a new job with a single insert, all of them start awaiting so only the first
+        one is validated, the primary keys are set back on the databases which support it (e.g. postgres, sqlite)
+        """
+        instances = [cls(job=job, task=task) for task in tasks]
+        if instances:
+            instances[0].full_clean()
+            cls.objects.bulk_create(instances)
+        return instances
 
-        for child in self.get_childs():
-            child.reopen()
+    def claim(self, worker):
+        """
+        marks the task instance as initialized by worker only if nobody else has changed its status meanwhile, the row
+        is locked skipping the ones locked by other workers where the database supports it otherwise it relies on the
+        conditional update
+        :return: True if this worker has claimed the task instance
+        """
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                candidate = JobTask.objects.filter(pk=self.pk, status=self.status).select_for_update(skip_locked=True)
+                if not candidate.values_list('pk', flat=True):
+                    return False
+            return self.transition(JobTask.initialized, worker=worker, pid=0)
+
+    def transition(self, status, expected=None, **fields):
+        """
+        changes the status with a single conditional update instead of saving the whole row, the same rules of clean
+        are applied and it only succeeds if the status in the database still is the expected one (current by default)
+        :param fields: other fields updated along with the status
+        :return: True if the transition was done, False if another one happened first
+        """
+        expected = expected or self.status
+        JobTask.check_transition(expected, status)
+
+        now = timezone.now()
+        if status == JobTask.initialized:
+            fields.setdefault('dt_start', now)
+            fields.setdefault('observations', '')
+        if status in JobTask.trunc_end_dt:
+            fields['dt_end'] = None
+        elif status in JobTask.set_end_dt:
+            fields.setdefault('dt_end', now)
+
+        done = JobTask.objects.filter(pk=self.pk, status=expected).update(status=status, **fields)
+        if done:
+            for field, value in fields.items():
+                setattr(self, field, value)
+            self.status = self._status = status
+            # the update does not send post_save so the other workers are woken up here
+            notify_change()
+        return bool(done)
 
-    def clean(self):
+    @staticmethod
+    def check_transition(current, status):
+        """
+        raises ValidationError if the status requested is not valid or can not be reached from the current one
+        """
         # check available status
-        if self.status not in [i[0] for i in JobTask.status_choices]:
+        if status not in [i[0] for i in JobTask.status_choices]:
             raise ValidationError(
-                {'status': _(f'status requested {self.status} not in status choices')}
+                {'status': _(f'status requested {status} not in status choices')}
             )
-        
+
         # check if new status is available for current status
-        if self.status == JobTask.cancelled and self._status not in JobTask.can_cancel:
+        if status == JobTask.cancelled and current not in JobTask.can_cancel:
             raise ValidationError(
                 {'status': _("can't cancel current status not valid")}
             )
-        elif self.status == JobTask.retry and self._status not in JobTask.can_retry:
+        elif status == JobTask.retry and current not in JobTask.can_retry:
             raise ValidationError(
                 {'status': _("can't retry current status not valid")}
             )
-        elif self.status == JobTask.forced and self._status not in JobTask.can_force:
+        elif status == JobTask.forced and current not in JobTask.can_force:
             raise ValidationError(
                 {'status': _("can't force current status not valid")}
             )
 
+    def get_childs(self):
+        from process.dag import get_dag
+        return JobTask.objects.filter(job=self.job, task_id__in=get_dag(self.job.process).childs.get(self.task_id, []))
+
+    def get_parents(self):
+        from process.dag import get_dag
+        return JobTask.objects.filter(job=self.job, task_id__in=get_dag(self.job.process).parents.get(self.task_id, []))
+
+    def reopen(self, main=None):
+        """
+        reopens the task instance and sets awaiting all its descendants in CASCADE, the descendants are found in the
+        graph of the process and all of them are updated at once
+        """
+        if main and self.status not in JobTask.can_reopen:
+            raise ValidationError(
+                {'status': _("can't reopen current status not valid")}
+            )
+
+        from process.dag import get_dag
+        descendants = get_dag(self.job.process).descendants(self.task_id)
+
+        with transaction.atomic():
+            self.status = JobTask.reopened if main else JobTask.awaiting
+            self.save()
+            JobTask.objects.filter(job_id=self.job_id, task_id__in=descendants).update(
+                status=JobTask.awaiting, dt_end=None
+            )
+
+    def clean(self):
+        JobTask.check_transition(self._status, self.status)
+
         # DT_START
         if self.status == JobTask.initialized:
             self.dt_start = timezone.now()
@@ -486,3 +642,133 @@ class JobTask(models.Model):
             if self.job.status in [Job.error, Job.finished]:
                 self.job.status = Job.initialized
                 self.job.save()
+
+
+class JobTaskUsage(models.Model):
+    """
+    resource usage of the process of a task instance reported by the operating system when it finished, only the
+    last execution is kept if the task instance runs again, the max resident memory is an upper bound because the
+    kernel also counts the memory the child inherited from run_jobs (or the fork server) before exec
+    """
+    job_task = models.OneToOneField(
+        JobTask,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name=_("job task"),
+        related_name='usage'
+    )
+    user_time = models.FloatField(_("user cpu seconds"))
+    system_time = models.FloatField(_("system cpu seconds"))
+    max_rss_bound = models.PositiveBigIntegerField(_("max resident memory upper bound in bytes"))
+    block_input = models.PositiveBigIntegerField(_("block input operations"))
+    block_output = models.PositiveBigIntegerField(_("block output operations"))
+    voluntary_switches = models.PositiveBigIntegerField(_("voluntary context switches"))
+    involuntary_switches = models.PositiveBigIntegerField(_("involuntary context switches"))
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'{self.job_task_id}[{self.cpu_time:.2f}s]'
+
+    class Meta:
+        db_table = 'pr_job_task_usage'
+        verbose_name = _('job task usage')
+        verbose_name_plural = _('job task usages')
+
+    @property
+    def cpu_time(self):
+        return self.user_time + self.system_time
+
+    @classmethod
+    def record(cls, job_task, rusage):
+        """
+        saves the resource usage returned by os.wait4 or any object with the same attributes, it is a single upsert
+        because a select followed by an insert fails at once on sqlite when another worker is writing
+        """
+        # linux reports the max rss in kilobytes, macOS in bytes
+        max_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+        usage = cls(
+            job_task=job_task,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            max_rss_bound=max_rss,
+            block_input=rusage.ru_inblock,
+            block_output=rusage.ru_oublock,
+            voluntary_switches=rusage.ru_nvcsw,
+            involuntary_switches=rusage.ru_nivcsw,
+        )
+        fields = [field.name for field in cls._meta.concrete_fields if not field.primary_key]
+        cls.objects.bulk_create([usage], update_conflicts=True, unique_fields=['job_task'], update_fields=fields)
+        return usage
+
+
+class Lease(models.Model):
+    """
+    A Lease elects a single holder among the run_jobs workers, e.g. the one that creates the jobs each minute, the
+    holder must renew it before it expires otherwise another worker will take it over
+    """
+    scheduler = 'scheduler'
+    worker_prefix = 'worker '
+
+    name = models.CharField(_("name"), max_length=150, unique=True)
+    holder = models.CharField(_("holder"), max_length=100)
+    dt_heartbeat = models.DateTimeField(_("heartbeat date"))
+    dt_expire = models.DateTimeField(_("expire date"))
+    objects = models.Manager()
+
+    def __str__(self):
+        return f'{self.name}[{self.holder}]'
+
+    class Meta:
+        db_table = 'pr_leases'
+        verbose_name = _('lease')
+        verbose_name_plural = _('leases')
+        ordering = ['name']
+
+    @classmethod
+    def acquire(cls, name, holder, ttl):
+        """
+        renews the lease if holder has it or takes it if it is free or expired
+        :return: True if holder has the lease for the next ttl seconds
+        """
+        now = timezone.now()
+        expire = now + timedelta(seconds=ttl)
+        renewed = cls.objects.filter(Q(holder=holder) | Q(dt_expire__lt=now), name=name).update(
+            holder=holder, dt_heartbeat=now, dt_expire=expire
+        )
+        if renewed:
+            return True
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, holder=holder, dt_heartbeat=now, dt_expire=expire)
+            return True
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def worker(worker):
+        """
+        :return: name of the lease each run_jobs worker keeps while it is alive
+        """
+        return f'{Lease.worker_prefix}{worker}'
+
+    @classmethod
+    def release(cls, name, holder):
+        """
+        expires the lease right away so another worker can take it over without waiting, the worker leases are
+        deleted instead since each run_jobs has its own
+        """
+        leases = cls.objects.filter(name=name, holder=holder)
+        if name.startswith(cls.worker_prefix):
+            leases.delete()
+        else:
+            leases.update(dt_expire=timezone.now())
+
+    @classmethod
+    def purge_workers(cls):
+        """
+        deletes the leases of the workers which stopped without releasing them
+        :return: number of leases deleted
+        """
+        deleted, __ = cls.objects.filter(name__startswith=cls.worker_prefix, dt_expire__lt=timezone.now()).delete()
+        return deleted
@@ -0,0 +1,80 @@
+import select
+import logging
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from process.conf import get_conf
+
+logger = logging.getLogger('django-process')
+
+_backend = None
+
+
+class BaseNotificationBackend:
+    """
+    Notification backends let other processes (e.g. the web server) wake up the run_jobs dispatcher when they change
+    a job or a task instead of waiting for the next heartbeat
+    """
+    channel = get_conf('dispatcher__notification_channel')
+
+    def notify(self):
+        """
+        called after a job or a task instance has been saved
+        """
+        raise NotImplementedError
+
+    def listen(self, callback):
+        """
+        blocks forever calling callback each time a notification is received, it runs in a daemon thread of run_jobs
+        """
+        raise NotImplementedError
+
+
+class PostgresNotificationBackend(BaseNotificationBackend):
+    """
+    uses postgres LISTEN/NOTIFY, the notification is delivered when the transaction that sent it is committed
+    """
+    def notify(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'NOTIFY {self.channel}')
+
+    def listen(self, callback):
+        conn = connection.get_new_connection(connection.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+
+        # psycopg 3 exposes a blocking generator
+        if callable(conn.notifies):
+            for __ in conn.notifies():
+                callback('notification')
+            return
+
+        # psycopg2 requires polling the connection when its socket is readable
+        while True:
+            if select.select([conn], [], [], 60) == ([], [], []):
+                continue
+            conn.poll()
+            if conn.notifies:
+                conn.notifies.clear()
+                callback('notification')
+
+
+def get_notification_backend():
+    """
+    returns the configured notification backend instance or None if there is not any configured
+    """
+    global _backend
+    path = get_conf('dispatcher__notification_backend')
+    if path and _backend is None:
+        _backend = import_string(path)()
+    return _backend
+
+
+def notify_change():
+    """
+    wakes up the run_jobs dispatchers once the current transaction is committed, only if a backend is configured
+    """
+    backend = get_notification_backend()
+    if backend:
+        transaction.on_commit(backend.notify)
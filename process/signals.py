@@ -0,0 +1,36 @@
+import logging
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from process.dag import bump_dag_version
+from process.models import Job, JobTask, Task, TaskDependence
+from process.notifications import notify_change
+
+logger = logging.getLogger('django-process')
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Job)
+@receiver(post_save, sender=JobTask)
+def notify_dispatcher(sender, **kwargs):
+    """
+    wakes up the run_jobs dispatcher when a job or a task instance changes, only if a backend is configured
+    """
+    notify_change()
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    bump_dag_version(instance.process_id)
+
+
+# noinspection PyUnusedLocal
+@receiver(post_save, sender=TaskDependence)
+@receiver(post_delete, sender=TaskDependence)
+def dependence_changed(sender, instance, **kwargs):
+    # when the dependence is deleted in cascade with its task the task signal takes care of it
+    process_id = Task.objects.filter(pk=instance.task_id).values_list('process_id', flat=True).first()
+    if process_id:
+        bump_dag_version(process_id)
@@ -2,6 +2,7 @@ from django import template
 from django.utils.safestring import mark_safe
 
 from process.conf import get_conf
+from process.dag import get_dag
 from ..models import Process, Job, JobTask
 
 register = template.Library()
@@ -82,13 +83,15 @@ def diagram(obj):
 
     data = []
     nodes = []
+    dag = get_dag(process)
     # noinspection PyUnresolvedReferences
-    for task in obj.tasks.all():
+    tasks = obj.tasks.all() if isinstance(obj, Process) else obj.tasks.select_related('job__process', 'task')
+    for task in tasks:
         nodes.append(get_task_as_node(task))
         tk = task if isinstance(obj, Process) else task.task
-        if tk.childs.all().count():
-            for child in tk.childs.all():
-                data.append([str(tk.name), str(child.task.name)])
+        if dag.childs.get(tk.id):
+            for child in dag.childs[tk.id]:
+                data.append([str(tk.name), str(dag.names[child])])
         else:
             data.append([str(tk.name), str(tk.name)])
 
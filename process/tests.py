@@ -0,0 +1,189 @@
+from types import SimpleNamespace
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+
+from process.management.commands._actions import schedule_processes
+from process.models import Process, Task, TaskDependence, Job, JobTask, JobTaskUsage, Lease
+
+
+class JobTaskReadyTests(TestCase):
+    """
+    ready() must take a single query whatever the number of jobs and dependency levels
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.process = Process.objects.create(
+            name='ready', description='ready', minute='0', hour='0', day_of_month='1', month='1', day_of_week='*'
+        )
+        # three levels, every task depends on all the tasks of the previous level
+        cls.levels = [
+            [
+                Task.objects.create(
+                    process=cls.process, name=f'ready-{level}-{n}', description=f'ready-{level}-{n}', level=level,
+                    interpreter='sh', code='dj_process_tasks/ready.sh'
+                )
+                for n in range(3)
+            ]
+            for level in range(3)
+        ]
+        for parents, childs in zip(cls.levels, cls.levels[1:]):
+            for task in childs:
+                for parent in parents:
+                    TaskDependence.objects.create(parent=parent, task=task)
+        cls.jobs = [Job.create(cls.process)[0] for __ in range(4)]
+
+    def finish(self, job, level):
+        JobTask.objects.filter(job=job, task__in=self.levels[level]).update(status=JobTask.finished)
+
+    def ready(self, expected_queries=1):
+        with self.assertNumQueries(expected_queries):
+            # the related objects used by the dispatcher must not query either
+            return {(t.job_id, t.task_id, t.job.process.name, t.task.name) for t in JobTask.ready()}
+
+    def test_roots_of_every_job(self):
+        ready = self.ready()
+        expected = {(job.id, task.id) for job in self.jobs for task in self.levels[0]}
+        self.assertEqual({(job_id, task_id) for job_id, task_id, __, __ in ready}, expected)
+
+    def test_levels(self):
+        self.finish(self.jobs[0], 0)
+        self.finish(self.jobs[1], 0)
+        self.finish(self.jobs[1], 1)
+        # one parent pending keeps all the childs waiting
+        JobTask.objects.filter(job=self.jobs[2], task__in=self.levels[0][:2]).update(status=JobTask.finished)
+
+        ready = {(job_id, task_id) for job_id, task_id, __, __ in self.ready()}
+        expected = {(self.jobs[0].id, task.id) for task in self.levels[1]}
+        expected |= {(self.jobs[1].id, task.id) for task in self.levels[2]}
+        expected |= {(self.jobs[2].id, self.levels[0][2].id)}
+        expected |= {(self.jobs[3].id, task.id) for task in self.levels[0]}
+        self.assertEqual(ready, expected)
+
+    def test_queries_do_not_grow_with_jobs(self):
+        for __ in range(6):
+            Job.create(self.process)
+        for job in Job.objects.all():
+            self.finish(job, 0)
+        self.assertEqual(len(self.ready()), Job.objects.count() * 3)
+
+    def test_unfinished_jobs_only(self):
+        Job.objects.filter(pk=self.jobs[0].pk).update(status=Job.finished)
+        self.assertNotIn(self.jobs[0].id, {job_id for job_id, __, __, __ in self.ready()})
+
+
+class JobTaskNotificationTests(TestCase):
+    """
+    status changes done with a conditional update must wake up the other workers as save() does
+    """
+    @classmethod
+    def setUpTestData(cls):
+        process = Process.objects.create(
+            name='notify', description='notify', minute='0', hour='0', day_of_month='1', month='1', day_of_week='*'
+        )
+        Task.objects.create(process=process, name='notify', description='notify', interpreter='sh', code='x.sh')
+        cls.job_task = Job.create(process)[1][0]
+
+    def setUp(self):
+        self.backend = mock.Mock()
+        patcher = mock.patch('process.notifications.get_notification_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_claim(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.job_task.claim('worker'))
+        self.backend.notify.assert_called()
+
+    def test_transition(self):
+        self.job_task.claim('worker')
+        self.backend.notify.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.job_task.transition(JobTask.finished))
+        self.backend.notify.assert_called_once_with()
+
+    def test_no_notification_when_the_transition_is_lost(self):
+        JobTask.objects.filter(pk=self.job_task.pk).update(status=JobTask.finished)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(self.job_task.transition(JobTask.initialized))
+        self.backend.notify.assert_not_called()
+
+
+class JobTaskUsageTests(TestCase):
+    """
+    the usage is written with a single statement whether the row exists or not
+    """
+    @classmethod
+    def setUpTestData(cls):
+        process = Process.objects.create(
+            name='usage', description='usage', minute='0', hour='0', day_of_month='1', month='1', day_of_week='*'
+        )
+        Task.objects.create(process=process, name='usage', description='usage', interpreter='sh', code='x.sh')
+        cls.job_task = Job.create(process)[1][0]
+
+    @staticmethod
+    def rusage(cpu):
+        return SimpleNamespace(
+            ru_utime=cpu, ru_stime=0.5, ru_maxrss=1024, ru_inblock=1, ru_oublock=2, ru_nvcsw=3, ru_nivcsw=4
+        )
+
+    def test_insert_then_update(self):
+        with self.assertNumQueries(1):
+            JobTaskUsage.record(self.job_task, self.rusage(1.0))
+        with self.assertNumQueries(1):
+            JobTaskUsage.record(self.job_task, self.rusage(2.0))
+        usage = JobTaskUsage.objects.get()
+        self.assertEqual((usage.job_task_id, usage.cpu_time), (self.job_task.id, 2.5))
+
+
+class ScheduleProcessesTests(TestCase):
+    """
+    processes without next run are scheduled once, the ones which never fire must not count as scheduled
+    """
+    def create(self, name, day_of_month, month):
+        process = Process.objects.create(
+            name=name, description=name, minute='0', hour='0', day_of_month=day_of_month, month=month, day_of_week='*'
+        )
+        Process.objects.filter(pk=process.pk).update(next_run_at=None)
+        return process
+
+    def test_schedule_once(self):
+        process = self.create('daily', '*', '*')
+        now = timezone.now()
+        self.assertEqual(schedule_processes(now), 1)
+        self.assertEqual(schedule_processes(now), 0)
+        process.refresh_from_db()
+        self.assertEqual(process.next_run_at, process.next_run(now))
+
+    def test_never_fires(self):
+        process = self.create('never', '31', '2')
+        now = timezone.now()
+        self.assertEqual(schedule_processes(now), 0)
+        self.assertEqual(schedule_processes(now), 0)
+        process.refresh_from_db()
+        self.assertIsNone(process.next_run_at)
+
+
+class LeaseTests(TestCase):
+    """
+    each run_jobs start has its own worker lease so they must not pile up
+    """
+    def test_release_deletes_worker_lease(self):
+        name = Lease.worker('host:1')
+        Lease.acquire(name, 'host:1', 30)
+        Lease.release(name, 'host:1')
+        self.assertFalse(Lease.objects.filter(name=name).exists())
+
+    def test_release_expires_scheduler_lease(self):
+        Lease.acquire(Lease.scheduler, 'host:1', 30)
+        Lease.release(Lease.scheduler, 'host:1')
+        self.assertTrue(Lease.acquire(Lease.scheduler, 'host:2', 30))
+
+    def test_purge_expired_workers_only(self):
+        Lease.acquire(Lease.worker('host:1'), 'host:1', -1)
+        Lease.acquire(Lease.worker('host:2'), 'host:2', 30)
+        Lease.acquire(Lease.scheduler, 'host:1', -1)
+        self.assertEqual(Lease.purge_workers(), 1)
+        self.assertEqual(
+            set(Lease.objects.values_list('name', flat=True)), {Lease.worker('host:2'), Lease.scheduler}
+        )
@@ -1,6 +1,6 @@
 from django.conf.urls import url
 from process.models import Job, Process
-from .views import process, task, job, jobtask, diagram
+from .views import process, task, job, jobtask, diagram, metrics
 
 urlpatterns = [
     # Processes
@@ -21,4 +21,7 @@ urlpatterns = [
     url(r'^jobs/(?P<pk>[0-9]+)/diagram/$', diagram.DiagramView.as_view(model=Job), name='process-job-diagram'),
     # JobTasks
     url(r'^job-tasks/$', jobtask.JobTaskListView.as_view(), name='process-job-tasks'),
+    url(r'^job-tasks/(?P<pk>[0-9]+)/log/$', jobtask.JobTaskLogView.as_view(), name='process-job-tasks-log'),
+    # Metrics
+    url(r'^metrics/$', metrics.MetricsView.as_view(), name='process-metrics'),
 ]
@@ -1,5 +1,6 @@
 import logging
 from django.contrib import messages
+from django.db.models import F, Max, Sum
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from django.views import View
@@ -21,6 +22,13 @@ class JobListView(ProcessGenericListView):
     filters = get_conf('views__job__list__url_allow_filters')
     permissions = get_conf('views__job__list__permissions')
 
+    def get_queryset(self):
+        # resource usage of all the task instances of each job, the default ordering is not applied when grouping
+        return super().get_queryset().select_related('process').annotate(
+            cpu_time=Sum(F('tasks__usage__user_time') + F('tasks__usage__system_time')),
+            max_rss_bound=Max('tasks__usage__max_rss_bound'),
+        ).order_by(*Job._meta.ordering)
+
     def post(self, request, *args, **kwargs):
         request = JobCancelView.as_view()(request)
         # noinspection PyTypeChecker
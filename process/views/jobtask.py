@@ -1,5 +1,6 @@
 import logging
 from django.contrib import messages
+from django.http import Http404, StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django.shortcuts import get_object_or_404
@@ -32,6 +33,9 @@ class JobTaskListView(ProcessGenericListView):
     filters = get_conf('views__jobtask__list__url_allow_filters')
     permissions = get_conf('views__jobtask__list__permissions')
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('job__process', 'task', 'usage')
+
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, args, kwargs)
@@ -63,3 +67,36 @@ class JobTaskManagementView(ProcessSecurity, View):
             messages.error(request, _(f'{e}'))
         finally:
             return request
+
+
+def read_segments(files, chunk_size=65536):
+    try:
+        for f in files:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+    finally:
+        for f in files:
+            f.close()
+
+
+# noinspection SpellCheckingInspection
+class JobTaskLogView(ProcessSecurity, View):
+    permissions = get_conf('views__jobtask__log__permissions')
+
+    # noinspection PyUnusedLocal
+    def get(self, request, pk, *args, **kwargs):
+        task = get_object_or_404(JobTask, id=pk)
+        # segments rotated by the runner are named .1 (newest) to .N (oldest) and come before the active file
+        backups = range(get_conf('task__log__backup_count'), 0, -1)
+        paths = [f'{task.log_path}.{i}' for i in backups] + [task.log_path]
+        # all the segments are opened first so a rotation while streaming does not skip or repeat any of them
+        files = []
+        for path in paths:
+            try:
+                files.append(open(path, 'rb'))
+            except FileNotFoundError:
+                pass
+        if not files:
+            raise Http404(_('log file does not exists'))
+        # the segments are streamed so big logs are not loaded in memory
+        return StreamingHttpResponse(read_segments(files), content_type='text/plain; charset=utf-8')
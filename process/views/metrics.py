@@ -0,0 +1,21 @@
+from django.http import HttpResponse
+from django.views import View
+
+from process import metrics
+from process.conf import get_conf
+from .generic_views import ProcessSecurity
+
+
+class MetricsView(ProcessSecurity, View):
+    permissions = get_conf('views__metrics__permissions')
+
+    def dispatch(self, request, *args, **kwargs):
+        if get_conf('views__metrics__public'):
+            return View.dispatch(self, request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    # noinspection PyUnusedLocal
+    def get(self, request, *args, **kwargs):
+        # the snapshots written by the run_jobs workers
+        text = metrics.render(metrics.load_snapshots())
+        return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,10 +3,11 @@ from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.db import transaction
 from django.http import HttpResponseRedirect
-from django.shortcuts import redirect, get_object_or_404
+from django.shortcuts import redirect
 from django.utils.translation import gettext_lazy as _
 
 from process.conf import get_conf
+from process.dag import bump_dag_version
 from .generic_views import (
     ProcessGenericCreateView,
     ProcessGenericListView,
@@ -70,6 +71,12 @@ class TaskUpdateView(ProcessGenericUpdateView):
         'offset',
         'interpreter',
         'arguments',
+        'max_parallel',
+        'priority',
+        'timeout',
+        'cpu_limit',
+        'memory_limit',
+        'nofile_limit',
         'code',
     ]
 
@@ -116,11 +123,22 @@ class TaskUpdateView(ProcessGenericUpdateView):
             with transaction.atomic():
                 self.object = form.save()
 
-                # get or create parent relation
+                # validate all the new parents at once, only the ones closing a cycle are flagged
+                parent_tasks = Task.objects.filter(id__in=[i['parent__id'] for i in new_parents])
+                cyclic = TaskDependence.cyclic_parents(self.object, parent_tasks)
+                if cyclic:
+                    for new_parent in new_parents:
+                        if new_parent['parent__id'] in cyclic:
+                            new_parent['badge'] = 'danger'
+                    raise ValidationError(_('cyclic relation detected'))
+
+                # create the missing relations with a single insert
+                current_ids = set(self.object.parents.values_list('parent_id', flat=True))
+                TaskDependence.objects.bulk_create(
+                    [TaskDependence(task=self.object, parent=p) for p in parent_tasks if p.id not in current_ids]
+                )
+                bump_dag_version(self.object.process_id)
                 for new_parent in new_parents:
-                    new_parent['badge'] = 'danger'
-                    parent_task = get_object_or_404(Task, id=new_parent['parent__id'])
-                    __, __ = TaskDependence.objects.get_or_create(task=self.object, parent=parent_task)
                     new_parent['badge'] = 'primary'
 
                 for current in self.object.parents.all():